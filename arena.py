@@ -0,0 +1,406 @@
+"""
+Headless, vectorized version of the tank game in game_old.py
+
+Every tank's position, vector, lives and reload timer, and every bullet's position, vector and owner, live in NumPy
+arrays, so one call to step() advances the whole arena. All tanks act on the same state each frame, and bullets that
+leave the arena for good are dropped. PyGame is only loaded by ArenaViewer, to watch a game.
+"""
+import multiprocessing
+import numpy as np
+import worker
+from fastnet import CompiledNetwork, NetworkCache, PopulationNetwork
+
+COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (255, 0, 255), (0, 255, 255), (0, 0, 0)]
+SCREEN_SIZE = 400
+GAME_LENGTH = 5_000
+FRAMERATE = 60
+
+N_LIVES = 5
+RELOAD_RATE = 30
+BULLET_SPEED = 5
+TANK_SPEED = 1
+TANK_SIZE = 25
+BULLET_SIZE = 3
+
+# network inputs: tank center, offset to and vector of the closest tank, offset to and vector of the closest bullet
+N_INPUTS = 10
+# network outputs: tank vector, bullet vector
+N_OUTPUTS = 4
+
+# layouts of recently compiled tank networks, reused for genomes with the same topology
+network_cache = NetworkCache()
+
+# tanks in each arena when a population is split into several (see ShardedEvaluator)
+ARENA_SIZE = 10
+# base seed for the shuffles and starting positions of sharded evaluations
+ARENA_SEED = 0
+
+
+def normalize(vectors, length):
+    """
+    Scales each row of :vectors: to :length:, leaving zero vectors as they are
+    """
+    mag = np.sqrt((vectors ** 2).sum(axis=1, keepdims=True))
+    return np.where(mag == 0, vectors, vectors * (length / np.where(mag == 0, 1, mag)))
+
+
+def group_slots(groups, n_groups):
+    """
+    Lays items out by group
+    :param groups: (M,) group of each item
+    :return: (slots, present): (n_groups, size of the largest group) arrays of the indices of each group's items in
+        increasing order, padded with item 0 where :present: is False
+    """
+    if n_groups == 1:
+        return np.arange(len(groups))[None], np.ones((1, len(groups)), dtype=bool)
+    sizes = np.bincount(groups, minlength=n_groups)
+    order = np.argsort(groups, kind='stable')
+    rank = np.arange(len(groups)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    slots = np.zeros((n_groups, sizes.max(initial=0)), dtype=int)
+    present = np.zeros(slots.shape, dtype=bool)
+    slots[groups[order], rank] = order
+    present[groups[order], rank] = True
+    return slots, present
+
+
+class TankArena():
+    """
+    N tanks fighting in one arena, stored as arrays:
+        pos: (N, 2) top-left corners of the tanks, vector: (N, 2) their last moves
+        lives, reloaded: (N,) lives left and frames until each tank can fire again
+        alive: (N,) whether each tank is still in the game
+        bullet_pos, bullet_vector: (B, 2) top-left corners and velocities of the bullets, bullet_owner: (B,)
+
+    The tanks can also be split into groups that only see and hit each other, so one TankArena plays the games of
+    several separate arenas at once, each exactly as it would play on its own. Tanks and bullets are laid out by
+    group (see group_slots) whenever they're compared, so a frame costs O(N * tanks per group) rather than O(N ** 2).
+    """
+    def __init__(self, n_tanks, seed=None, screen_size=SCREEN_SIZE, groups=None):
+        """
+        :param n_tanks: number of tanks
+        :param seed: seed for the starting positions, or a list of one seed per group; None uses the global NumPy
+            random state
+        :param screen_size: width and height of the arena in pixels
+        :param groups: (N,) group of each tank, numbered from 0; None puts every tank in one group
+        """
+        self.n_tanks = n_tanks
+        self.screen_size = screen_size
+        self.groups = np.zeros(n_tanks, dtype=int) if groups is None else np.asarray(groups, dtype=int)
+        self.n_groups = self.groups.max(initial=0) + 1
+        self.members, self.is_member = group_slots(self.groups, self.n_groups)
+
+        seeds = seed if np.ndim(seed) else [seed] * self.n_groups
+        self.pos = np.zeros((n_tanks, 2))
+        for group, group_seed in enumerate(seeds):
+            rng = np.random if group_seed is None else np.random.RandomState(group_seed)
+            members = self.groups == group
+            self.pos[members] = rng.randint(screen_size, size=(members.sum(), 2))
+        self.vector = np.zeros((n_tanks, 2))
+        self.lives = np.full(n_tanks, N_LIVES)
+        self.reloaded = np.zeros(n_tanks, dtype=int)
+        self.alive = np.ones(n_tanks, dtype=bool)
+        # fitness of each tank, as in game_old: minus the number of tanks of its group alive when it died, or 0 if it
+        # survived
+        self.fitness = np.zeros(n_tanks)
+
+        self.bullet_pos = np.zeros((0, 2))
+        self.bullet_vector = np.zeros((0, 2))
+        self.bullet_owner = np.zeros(0, dtype=int)
+
+        self.frame = 0
+
+    @property
+    def done(self):
+        return (self.alive_per_group() <= 1).all() or self.frame >= GAME_LENGTH
+
+    def alive_per_group(self, alive=None):
+        """
+        Returns the number of tanks alive in each group, by :alive: if given
+        """
+        return np.bincount(self.groups[self.alive if alive is None else alive], minlength=self.n_groups)
+
+    def centers(self):
+        return self.pos + TANK_SIZE // 2
+
+    def observations(self):
+        """
+        Returns the (N, N_INPUTS) network inputs of every tank, as AI_Tank.eval builds them. When there is no other
+        tank or bullet of its group, its position and vector are all 0.
+        """
+        centers = self.centers()
+        bullet_centers = self.bullet_pos + BULLET_SIZE // 2
+        members = self.members
+        member_centers = centers[members]
+
+        def closest(slots, present, points, vectors, owners):
+            """
+            Position and vector of the closest of :points: in each tank's group, laid out by group in :slots:,
+            skipping those that aren't :present: and those the tank :owners:
+            """
+            found = np.zeros((self.n_tanks, 4))
+            if not slots.size:
+                return found
+            dist = ((member_centers[:, :, None] - points[slots][:, None]) ** 2).sum(axis=3)
+            dist[~present[:, None] | (members[:, :, None] == owners[slots][:, None])] = np.inf
+            best = dist.argmin(axis=2)
+            has = np.isfinite(np.take_along_axis(dist, best[..., None], axis=2)[..., 0]) & self.is_member
+            best = np.take_along_axis(slots, best, axis=1)[has]
+            found[members[has], :2] = points[best]
+            found[members[has], 2:] = vectors[best]
+            return found
+
+        tank = closest(members, self.is_member & self.alive[members], centers, self.vector,
+                       np.arange(self.n_tanks))
+        bullet = closest(*group_slots(self.groups[self.bullet_owner], self.n_groups), bullet_centers,
+                         self.bullet_vector, self.bullet_owner)
+        return np.concatenate((centers, tank[:, :2] - centers, tank[:, 2:],
+                               bullet[:, :2] - centers, bullet[:, 2:]), axis=1)
+
+    def step(self, outputs):
+        """
+        Advance the arena by one frame
+        :param outputs: (N, N_OUTPUTS) network outputs of every tank: desired tank vector, then bullet vector.
+            Rows of dead tanks are ignored.
+        :return: whether the game is over
+        """
+        outputs = np.asarray(outputs, dtype=float)
+        live = self.alive
+
+        # wrap tanks that left the arena around to the other side, as border_pass does
+        self.pos[live] += self.screen_size * ((self.pos[live] < 0).astype(int) - (self.pos[live] > self.screen_size))
+
+        # move tanks
+        self.vector[live] = normalize(outputs[live, :2], TANK_SPEED)
+        self.pos[live] += np.round(self.vector[live])
+
+        # fire bullets from the centers of reloaded tanks, then count down reload timers
+        fire = np.flatnonzero(live & (self.reloaded == 0))
+        self.reloaded[fire] = RELOAD_RATE
+        self.bullet_pos = np.concatenate((self.bullet_pos, self.centers()[fire]))
+        self.bullet_vector = np.concatenate((self.bullet_vector, normalize(outputs[fire, 2:], BULLET_SPEED)))
+        self.bullet_owner = np.concatenate((self.bullet_owner, fire))
+        self.reloaded[live & (self.reloaded > 0)] -= 1
+
+        # each bullet hits the first live tank of its owner's group it overlaps, other than its owner
+        members = self.members
+        slots, present = group_slots(self.groups[self.bullet_owner], self.n_groups)
+        overlap = ((np.abs((self.bullet_pos[slots][:, None] + BULLET_SIZE / 2)
+                           - (self.pos[members][:, :, None] + TANK_SIZE / 2))
+                    < (TANK_SIZE + BULLET_SIZE) / 2).all(axis=3)
+                   & (self.is_member & live[members])[:, :, None] & present[:, None]
+                   & (members[:, :, None] != self.bullet_owner[slots][:, None]))
+        slot_hit = overlap.any(axis=1)
+        hit = np.zeros(len(self.bullet_owner), dtype=bool)
+        hit[slots[slot_hit]] = True
+        target = np.take_along_axis(members, overlap.argmax(axis=1), axis=1)[slot_hit]
+        hits = np.bincount(target, minlength=self.n_tanks)
+        # the shooter takes the lives of the tank it hits
+        self.lives += np.bincount(self.bullet_owner[hit], minlength=self.n_tanks) - hits
+        died = live & (self.lives <= 0)
+        self.fitness[died] = -self.alive_per_group(live)[self.groups[died]]
+        self.alive = live & ~died
+        kept = ~hit
+
+        # move bullets, dropping those that can no longer reach any tank
+        self.bullet_pos = self.bullet_pos[kept] + self.bullet_vector[kept]
+        self.bullet_vector = self.bullet_vector[kept]
+        self.bullet_owner = self.bullet_owner[kept]
+        reachable = ((self.bullet_pos > -TANK_SIZE - BULLET_SIZE)
+                     & (self.bullet_pos < self.screen_size + TANK_SIZE)).all(axis=1)
+        self.bullet_pos = self.bullet_pos[reachable]
+        self.bullet_vector = self.bullet_vector[reachable]
+        self.bullet_owner = self.bullet_owner[reachable]
+
+        self.frame += 1
+        return self.done
+
+    def winner(self):
+        """
+        :return: index and lives of the winning tank: the last one alive, or the live tank with the most lives
+        """
+        lives = np.where(self.alive, self.lives, -np.inf)
+        winner = int(lives.argmax())
+        return winner, int(self.lives[winner])
+
+
+class ArenaViewer():
+    """
+    Draws a TankArena with PyGame
+    """
+    def __init__(self, screen_size=SCREEN_SIZE, framerate=FRAMERATE):
+        """
+        :param framerate: most frames drawn per second; None to draw as fast as the arena runs
+        """
+        import pygame
+        self.pygame = pygame
+        pygame.init()
+        self.screen = pygame.display.set_mode([screen_size, screen_size])
+        self.clock = pygame.time.Clock()
+        self.framerate = framerate
+
+    def draw(self, arena):
+        """
+        Draws the arena
+        :return: False if the user closed the window or pressed escape
+        """
+        pygame = self.pygame
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                return False
+
+        self.screen.fill((255, 255, 255))
+        for i in np.flatnonzero(arena.alive):
+            pygame.draw.rect(self.screen, COLORS[i % len(COLORS)], (*arena.pos[i], TANK_SIZE, TANK_SIZE))
+        for pos in arena.bullet_pos:
+            pygame.draw.rect(self.screen, (0, 0, 0), (*pos, BULLET_SIZE, BULLET_SIZE))
+        pygame.display.flip()
+
+        if self.framerate:
+            self.clock.tick(self.framerate)
+        return True
+
+
+def play(genomes, config, seed=None, viewer=None, groups=None):
+    """
+    Plays one game with a tank for each genome, activating all of their networks together each frame, and sets
+    each genome's fitness
+    :param seed: seed for the starting positions, or a list of one seed per group
+    :param viewer: ArenaViewer to watch the game in
+    :param groups: (N,) group of each genome's tank, to play several separate games at once (see TankArena)
+    :return: index and lives of the winning tank, and the number of frames played
+    """
+    if config.genome_config.num_inputs != N_INPUTS or config.genome_config.num_outputs != N_OUTPUTS:
+        raise ValueError("tank networks need {} inputs and {} outputs".format(N_INPUTS, N_OUTPUTS))
+
+    population = PopulationNetwork([CompiledNetwork.create(genome, config, network_cache)
+                                    for genome_id, genome in genomes])
+    arena = TankArena(len(genomes), seed, groups=groups)
+    while not arena.step(population.activate(arena.observations())):
+        if viewer is not None and not viewer.draw(arena):
+            break
+
+    for (genome_id, genome), fitness in zip(genomes, arena.fitness):
+        genome.fitness = float(fitness)
+    return arena.winner() + (arena.frame,)
+
+
+def shard(n_tanks, n_arenas, seed):
+    """
+    Shuffles :n_tanks: tanks into :n_arenas: arenas whose sizes differ by at most one
+    :return: list of arrays of tank indices, one per arena
+    """
+    order = np.random.RandomState(seed).permutation(n_tanks)
+    return np.array_split(order, n_arenas)
+
+
+def _play_worker(task):
+    genomes, groups, seeds = task
+    play(genomes, worker.config, seeds, groups=groups)
+    return [genome.fitness for genome_id, genome in genomes]
+
+
+class ShardedEvaluator():
+    """
+    Splits the population into arenas of about :arena_size: tanks, reshuffled each generation, and splits the arenas
+    between a pool of worker processes. Each worker plays all of its arenas together as groups of one TankArena, so
+    a frame costs a few array operations however many arenas there are, and a tank only has to be checked against
+    the tanks and bullets of its own arena.
+
+    A tank's fitness is its TankArena fitness divided by the number of tanks in its arena: minus the share of its
+    arena still alive when it died (hits take lives, so they decide who that is), or 0 if it survived. Arenas of
+    different sizes are scored on the same scale. The shuffle and every arena's starting positions are derived from
+    the base seed and the generation, and arenas don't affect each other, so results don't depend on the number of
+    workers.
+
+    Pass evaluate() to neat.Population.run.
+    """
+    def __init__(self, config, workers=1, arena_size=ARENA_SIZE, base_seed=ARENA_SEED):
+        """
+        :param config: NEAT config, sent to each worker once
+        :param workers: number of worker processes; with 1, arenas are played in this process
+        :param arena_size: tanks in each arena
+        :param base_seed: seed that all shuffles and arena seeds are derived from
+        """
+        self.pool = (multiprocessing.Pool(workers, initializer=worker.init_config, initargs=(config,)) if workers > 1
+                     else None)
+        self.workers = workers
+        self.arena_size = arena_size
+        self.base_seed = base_seed
+        self.generation = 0
+
+    def evaluate(self, genomes, config):
+        """
+        Computes fitnesses of given genomes
+        """
+        n_arenas = max(1, round(len(genomes) / self.arena_size))
+        shuffle_seed, *arena_seeds = np.random.SeedSequence([self.base_seed, self.generation]).generate_state(
+            1 + n_arenas)
+        arenas = shard(len(genomes), n_arenas, shuffle_seed)
+
+        # each task is a batch of arenas, numbered from 0 within the batch
+        tasks = []
+        for batch in np.array_split(np.arange(n_arenas), min(self.workers, n_arenas)):
+            tasks.append(([genomes[i] for a in batch for i in arenas[a]],
+                          np.repeat(np.arange(len(batch)), [len(arenas[a]) for a in batch]),
+                          [int(arena_seeds[a]) for a in batch]))
+
+        if self.pool is None:
+            worker.init_config(config)
+            results = map(_play_worker, tasks)
+        else:
+            results = self.pool.map(_play_worker, tasks)
+        for (batch_genomes, groups, seeds), fitnesses in zip(tasks, results):
+            sizes = np.bincount(groups)
+            for (genome_id, genome), group, fitness in zip(batch_genomes, groups, fitnesses):
+                genome.fitness = float(fitness / sizes[group])
+        self.generation += 1
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+def run_neat(config_file, watch=False, workers=1, arena_size=None):
+    """
+    runs the NEAT algorithm to train a neural network to play the tank game
+    :param config_file: location of config file
+    :param watch: whether to watch each generation's game; only for unsharded games
+    :param workers: number of processes playing arenas
+    :param arena_size: tanks in each arena, splitting the population into several (see ShardedEvaluator); None
+        to play the whole population in one arena
+    :return: None
+    """
+    import neat
+    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                                neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                                config_file)
+
+    # Create the population, which is the top-level object for a NEAT run.
+    p = neat.Population(config)
+
+    # Add a stdout reporter to show progress in the terminal.
+    p.add_reporter(neat.StdOutReporter(True))
+    stats = neat.StatisticsReporter()
+    p.add_reporter(stats)
+    p.add_reporter(neat.Checkpointer(5))
+
+    if arena_size is None:
+        evaluator = None
+        viewer = ArenaViewer() if watch else None
+        fitness_function = lambda genomes, config: play(genomes, config, viewer=viewer)
+    else:
+        evaluator = ShardedEvaluator(config, workers, arena_size)
+        fitness_function = evaluator.evaluate
+
+    # Run for up to 20 generations.
+    winner = p.run(fitness_function, 20)
+    if evaluator is not None:
+        evaluator.close()
+
+    # show final stats
+    print('\nBest genome:\n{!s}'.format(winner))
+
+
+if __name__ == '__main__':
+    run_neat('config-tank.txt')
@@ -0,0 +1,304 @@
+"""
+Benchmarks for the Snake training loop
+
+Measures startup time, game steps/sec, observations/sec, activations/sec and full-generation wall time, using the
+bundled best_genome.pkl and best_config.pkl as a fixed workload. Each run appends one JSON line to the output file,
+tagged with the current commit, so results can be compared across commits.
+
+Usage: python bench.py [--output benchmarks.jsonl] [--quick]
+"""
+import argparse
+import copy
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import time
+
+import neat
+import numpy as np
+
+import bot
+import engine
+import game
+from fastnet import CompiledNetwork, NetworkCache, PopulationNetwork
+from vec_env import BatchSnakeEnv
+
+# lengths of the snakes used to time steps and observations
+SNAKE_LENGTHS = (1, 16, 64, 128)
+# population sizes used to time whole generations
+POPULATION_SIZES = (10, 50, 100)
+# number of games stepped at once by the batched benchmarks
+BATCH_SIZE = 1000
+# minimum time to spend on each measurement, in seconds
+MIN_TIME = 0.5
+# most seconds a fresh process should take to get a ready evaluator
+STARTUP_TARGET = 1.0
+# code timed by the startup benchmark; each runs in a fresh interpreter
+STARTUP_SCRIPTS = {
+    'python': 'pass',
+    'import_bot': 'import bot',
+    'evaluator': 'import pickle, bot; config = pickle.load(open({config!r}, "rb")); bot.SeededEvaluator()',
+}
+
+
+def rate(func, min_time=MIN_TIME):
+    """
+    Calls :func: repeatedly for at least :min_time: seconds
+    :return: calls per second
+    """
+    func()
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return calls / elapsed
+
+
+def cycle_actions(grid_size=engine.GRID_SIZE):
+    """
+    Returns a Hamiltonian cycle of the board as a dict of cell -> action, so a snake following it never dies
+    """
+    path = [(x, 0) for x in range(grid_size)]
+    for x in range(grid_size - 1, -1, -1):
+        ys = range(1, grid_size) if x % 2 else range(grid_size - 1, 0, -1)
+        path += [(x, y) for y in ys]
+
+    actions = {}
+    for cell, next_cell in zip(path, path[1:] + path[:1]):
+        dx, dy = next_cell[0] - cell[0], next_cell[1] - cell[1]
+        actions[cell] = {(0, -1): engine.UP, (1, 0): engine.RIGHT, (0, 1): engine.DOWN, (-1, 0): engine.LEFT}[dx, dy]
+    return actions
+
+
+def long_snake_env(length, actions):
+    """
+    Returns a SnakeEnv whose snake has :length: blocks and is following the cycle in :actions:, with the food off
+    the board so the snake never eats it
+    """
+    env = engine.SnakeEnv()
+    env.reset(0)
+    env.snake = engine.Snake((0, 0))
+    env.food = engine.Food((-engine.GRID_PAD, -engine.GRID_PAD))
+    for _ in range(length - 1):
+        env.snake.grow()
+        env.snake.dir = env.snake.moves[actions[env.snake.blocks[0]]]
+        env.snake.move()
+    return env
+
+
+def bench_engine(results, min_time):
+    """
+    Game steps/sec of SnakeEnv for several snake lengths, and of BatchSnakeEnv
+    """
+    actions = cycle_actions()
+    for length in SNAKE_LENGTHS:
+        env = long_snake_env(length, actions)
+
+        def step():
+            env.search_length = 0
+            env.step(actions[env.snake.blocks[0]])
+        results['engine.steps_per_sec.length_{}'.format(length)] = rate(step, min_time)
+
+    batch = BatchSnakeEnv(BATCH_SIZE)
+    batch.reset(0)
+    rng = np.random.RandomState(0)
+    results['vec_env.steps_per_sec'] = BATCH_SIZE * rate(lambda: batch.step(rng.randint(4, size=BATCH_SIZE)),
+                                                         min_time)
+
+
+def bench_observations(results, min_time):
+    """
+    Observations/sec of local_state for several snake lengths, and of the batched local_states
+    """
+    actions = cycle_actions()
+    for length in SNAKE_LENGTHS:
+        env = long_snake_env(length, actions)
+        results['local_state.per_sec.length_{}'.format(length)] = rate(
+            lambda: bot.local_state(env.snake, env.food), min_time)
+
+    batch = BatchSnakeEnv(BATCH_SIZE)
+    batch.reset(0)
+    results['local_states.per_sec'] = BATCH_SIZE * rate(
+        lambda: bot.local_states(batch.grid, batch.head, batch.food), min_time)
+
+
+def bench_networks(results, genome, config, min_time):
+    """
+    Activations/sec of neat's network and of the compiled networks, and compilations/sec with and without a
+    NetworkCache that already holds the genome's topology
+    """
+    state = list(np.random.RandomState(0).randint(0, 2, size=config.genome_config.num_inputs))
+    states = np.random.RandomState(1).randint(0, 2, size=(BATCH_SIZE, config.genome_config.num_inputs))
+
+    neat_net = neat.nn.FeedForwardNetwork.create(genome, config)
+    results['neat.activations_per_sec'] = rate(lambda: neat_net.activate(state), min_time)
+
+    net = CompiledNetwork.create(genome, config)
+    results['compiled.activations_per_sec'] = rate(lambda: net.activate(state), min_time)
+    results['compiled.batched_activations_per_sec'] = BATCH_SIZE * rate(lambda: net.activate(states), min_time)
+
+    results['compiled.creates_per_sec'] = rate(lambda: CompiledNetwork.create(genome, config), min_time)
+    cache = NetworkCache()
+    results['compiled.cached_creates_per_sec'] = rate(lambda: CompiledNetwork.create(genome, config, cache), min_time)
+
+    population = PopulationNetwork([net] * 100)
+    results['population.activations_per_sec'] = 100 * rate(lambda: population.activate(states[:100]), min_time)
+
+
+def bench_games(results, genome, config, min_time):
+    """
+    Steps/sec of whole games played by the bundled genome, headless with and without the policy memo and through
+    game.play with and without rendering, plus the memo's hit rate and the cost of the PyGame event pump
+    """
+    mover = bot.bot_mover_maker(CompiledNetwork.create(genome, config))
+    unmemoized_mover = bot.bot_mover_maker(CompiledNetwork.create(genome, config), memo_size=0)
+    env = engine.SnakeEnv()
+    seeds = iter(range(10 ** 9))
+
+    def headless():
+        env.reset(next(seeds))
+        env.run(mover)
+        return env.steps
+
+    def headless_no_memo():
+        env.reset(next(seeds))
+        env.run(unmemoized_mover)
+        return env.steps
+
+    def played():
+        steps = [0]
+        def counting_mover(snake, food):
+            steps[0] += 1
+            mover(snake, food)
+        game.play(counting_mover, seed=next(seeds))
+        return steps[0]
+
+    for name, func in (('headless', headless), ('headless_no_memo', headless_no_memo), ('play', played)):
+        steps = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_time:
+            steps += func()
+        results['game.steps_per_sec.{}'.format(name)] = steps / (time.perf_counter() - start)
+    results['game.memo_hit_rate'] = mover.memo.hit_rate
+
+    game.WATCH = True
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_time:
+        steps += played()
+    results['game.steps_per_sec.watched'] = steps / (time.perf_counter() - start)
+    game.WATCH = False
+    game.renderer.stop()
+    game.renderer = None
+
+    # the renderer pumps its window's events on its own thread, so time the pump on a window of our own
+    import pygame
+    pygame.init()
+    screen_size = engine.BoardSpec.get().screen_size
+    pygame.display.set_mode([screen_size, screen_size])
+    results['pygame.event_pumps_per_sec'] = rate(pygame.event.get, min_time)
+    pygame.quit()
+
+
+def bench_generations(results, genome, config):
+    """
+    Wall time of evaluating whole populations of copies of the bundled genome, one genome at a time and in lockstep
+    """
+    seeds = bot.seed_set()
+    for size in POPULATION_SIZES:
+        genomes = []
+        for key in range(size):
+            g = copy.deepcopy(genome)
+            g.key = key
+            genomes.append(g)
+
+        start = time.perf_counter()
+        for g in genomes:
+            g.fitness = bot.eval_genome(g, config, seeds)
+        results['generation.seconds.pop_{}'.format(size)] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        population = PopulationNetwork([CompiledNetwork.create(g, config) for g in genomes])
+        bot.play_lockstep(population, [seeds] * size)
+        results['generation.seconds.lockstep.pop_{}'.format(size)] = time.perf_counter() - start
+
+
+def bench_startup(results, config_file, runs=5):
+    """
+    Seconds for a fresh interpreter to start and import bot, and to get a ready evaluator, best of :runs:
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name, script in STARTUP_SCRIPTS.items():
+        script = script.format(config=os.path.abspath(config_file))
+        best = float('inf')
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.check_call([sys.executable, '-c', script], cwd=here)
+            best = min(best, time.perf_counter() - start)
+        results['startup.seconds.{}'.format(name)] = best
+
+
+def commit():
+    """
+    Returns the current git commit, or None outside a git checkout
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(genome_file, config_file, min_time=MIN_TIME):
+    """
+    Runs every benchmark
+    :return: dict of benchmark name -> result
+    """
+    genome = pickle.load(open(genome_file, 'rb'))
+    config = pickle.load(open(config_file, 'rb'))
+
+    # the watched benchmark renders off-screen unless SDL_VIDEODRIVER is set
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    game.WATCH = False
+    game.USE_FRAMERATE = False
+
+    results = {}
+    bench_startup(results, config_file)
+    bench_engine(results, min_time)
+    bench_observations(results, min_time)
+    bench_networks(results, genome, config, min_time)
+    bench_games(results, genome, config, min_time)
+    bench_generations(results, genome, config)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', default='benchmarks.jsonl', help='file to append results to')
+    parser.add_argument('--genome', default='best_genome.pkl')
+    parser.add_argument('--config', default='best_config.pkl')
+    parser.add_argument('--quick', action='store_true', help='spend less time on each measurement')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.genome, args.config, MIN_TIME / 5 if args.quick else MIN_TIME)
+    record = {
+        'commit': commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'results': results,
+    }
+    with open(args.output, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+    for name, value in results.items():
+        print('{:<45} {:>14,.3f}'.format(name, value) if name.startswith(('startup.', 'game.memo')) else
+              '{:<45} {:>14,.1f}'.format(name, value))
+    if results['startup.seconds.evaluator'] > STARTUP_TARGET:
+        print('startup to a ready evaluator is over the {}s target'.format(STARTUP_TARGET))
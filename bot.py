@@ -4,119 +4,569 @@ Code for training a Snake bot using NEAT
 
 
 """
+import collections
+import functools
+import hashlib
+import multiprocessing
 import pickle
-import neat
 import numpy as np
+import profiling
+import worker
+from engine import BoardSpec, SnakeEnv
+from fastnet import CompiledNetwork, NetworkCache, PopulationNetwork
+from lru import LRUCache
 from game import play
+from vec_env import BatchSnakeEnv
 import game
 
 # how many plays to average together in each fitness calculation
 PLAYS_PER_BOT = 3
-# how far to allow the bot to see
-VISION_BOX = 5
+# base seed for evaluations that play seeded games
+EVAL_SEED = 0
+# version of the fixed seed set that SeededEvaluator plays; bump it to score genomes on a new set of games
+SEED_SET_VERSION = 1
+# observations each bot mover remembers the chosen direction of
+MEMO_SIZE = 4096
 
+# layouts of recently compiled networks, reused for genomes with the same topology in later generations (one cache per
+# process, so pool workers each keep their own)
+network_cache = NetworkCache()
 
 
-def bot_mover_maker(model):
+
+def bot_mover_maker(model, memo_size=MEMO_SIZE, spec=None):
     """
     Returns a function that, when called, uses the given model to suggest a direction for the snake to move, given
-    the current state
-    :param model: neat.nn.FeedForwardNetwork object
+    the current state. Networks are deterministic, so the direction chosen for each observation is remembered in a
+    PolicyMemo (the mover's .memo) and the network is only activated for observations it hasn't seen recently.
+    :param model: fastnet.CompiledNetwork or neat.nn.FeedForwardNetwork object
+    :param memo_size: most observations to remember; 0 to always activate the network
+    :param spec: engine.BoardSpec the bot sees the board with; defaults to the snake's own
     :return: function with args (state, snake)
     """
+    memo = PolicyMemo(memo_size)
+    # phases are timed only when profiling was on when the mover was made
+    prof = profiling.profiler
+
     def bot_mover(snake, food):
-        state = local_state(snake, food)
-        guesses = model.activate(state)
-
-        new_dir = np.argmax(guesses)
-        if new_dir == 0:
-            snake.dir = snake.up
-        elif new_dir == 1:
-            snake.dir = snake.right
-        elif new_dir == 2:
-            snake.dir = snake.down
-        elif new_dir == 3:
-            snake.dir = snake.left
+        if prof is not None:
+            prof.start('observation')
+        state = local_state(snake, food, spec)
+        key = observation_key(state)
+        if prof is not None:
+            prof.stop()
+        new_dir = memo.get(key)
+        if new_dir is None:
+            if prof is not None:
+                prof.start('activation')
+            new_dir = int(np.argmax(model.activate(state)))
+            if prof is not None:
+                prof.stop()
+            memo.put(key, new_dir)
+        snake.dir = snake.moves[new_dir]
 
+    bot_mover.memo = memo
     return bot_mover
 
 
-def is_occupied(pos, snake):
-    """
-    Return whether a grid point :pos: is blank (0) or not (1)
-    """
-    if pos in snake.blocks: # snake tail
-        return 1
-    if not 0 <= pos[0] < game.GRID_SIZE or not 0 <= pos[1] < game.GRID_SIZE: # border
-        return 1
-    else:                # blank
-        return 0
-
-def local_state(snake, food):
+def local_state(snake, food, spec=None):
     """
     Returns whether the points in a grid around the snake's head are occupied,
         plus booleans identifying direction to food
 
-    :return: flattened VISION_BOX x VISION_BOX binary matrix
+    :param spec: engine.BoardSpec whose vision box to look at; defaults to the snake's. The head must be on its board.
+    :return: flattened vision_box x vision_box binary matrix
     """
-    state = []
+    spec = snake.spec if spec is None else spec
     head = snake.blocks[0]
 
     # local state (5x5 grid around snake)
-    for i in range(-VISION_BOX // 2 + 1, VISION_BOX // 2 + 1):
-        for j in range(-VISION_BOX // 2 + 1, VISION_BOX // 2 + 1):
-            if i != 0 or j != 0:
-
-                state.append(is_occupied((head[0] + j, head[1] + i), snake))
+    cell = spec.cell(head)
+    state = np.empty(spec.vision.shape[1] + 4, dtype=np.int8)
+    state[:-4] = (snake.grid.ravel()[spec.vision[cell]] > 0) | spec.vision_walls[cell]
 
     # four booleans: is food up, down, left, or right?
-    food_direction = (
-            1 if food.pos[1] < head[1] else 0,
-            1 if food.pos[1] > head[1] else 0,
-            1 if food.pos[0] < head[0] else 0,
-            1 if food.pos[0] > head[0] else 0
+    state[-4:] = (
+            food.pos[1] < head[1],
+            food.pos[1] > head[1],
+            food.pos[0] < head[0],
+            food.pos[0] > head[0]
     )
-    state += [*food_direction]
     return state
 
 
+def local_states(grids, heads, foods, spec=None):
+    """
+    Batched local_state for many games, such as those of a vec_env.BatchSnakeEnv
+    :param grids: (N, H, W) padded occupancy grids
+    :param heads: (N, 2) head positions
+    :param foods: (N, 2) food positions
+    :param spec: engine.BoardSpec of the boards; defaults to BoardSpec.get()
+    :return: (N, vision_box ** 2 + 3) array of states
+    """
+    spec = BoardSpec.get() if spec is None else spec
+    n_games = len(grids)
+
+    cells = heads[:, 1] * spec.grid_size + heads[:, 0]
+    states = np.empty((n_games, spec.vision.shape[1] + 4), dtype=np.int8)
+    seen = np.take_along_axis(grids.reshape(n_games, -1), spec.vision[cells], axis=1)
+    states[:, :-4] = (seen > 0) | spec.vision_walls[cells]
+    states[:, -4] = foods[:, 1] < heads[:, 1]
+    states[:, -3] = foods[:, 1] > heads[:, 1]
+    states[:, -2] = foods[:, 0] < heads[:, 0]
+    states[:, -1] = foods[:, 0] > heads[:, 0]
+    return states
+
+
+@functools.lru_cache(maxsize=None)
+def key_weights(n_bits):
+    """
+    Returns the value of each bit of an observation key
+    """
+    return 1 << np.arange(n_bits, dtype=np.int64)
+
+
+def observation_key(state):
+    """
+    Packs a binary state from local_state into an int (28 bits with the default engine.VISION_BOX)
+    """
+    return int(state.dot(key_weights(len(state))))
+
+
+def observation_keys(states):
+    """
+    Packs an (N, S) array of binary states, such as from local_states, into an (N,) array of keys
+    """
+    return states.dot(key_weights(states.shape[1]))
+
+
+class PolicyMemo(LRUCache):
+    """
+    Least-recently-used table of the direction a network chose for each observation key
+    """
+    def __init__(self, maxsize=MEMO_SIZE):
+        super().__init__(maxsize)
+
+
 def train_generation(genomes, config):
     """
-    Computes fitnesses of given genomes
+    Computes fitnesses of given genomes, leaving the number of game steps played in train_generation.steps_played
     """
+    prof = profiling.profiler
+    train_generation.steps_played = 0
     for i, (genome_id, genome) in enumerate(genomes):
         genome.fitness = 0
-        model = neat.nn.FeedForwardNetwork.create(genome, config)
+        if prof is not None:
+            prof.start_genome(genome_id)
+            prof.start('network.create')
+        model = CompiledNetwork.create(genome, config, network_cache)
+        if prof is not None:
+            prof.stop()
         bot_mover = bot_mover_maker(model)
+
+        # the mover is called once per step
+        def counting_mover(snake, food):
+            train_generation.steps_played += 1
+            bot_mover(snake, food)
+
         for _ in range(PLAYS_PER_BOT):
-            genome.fitness += play(bot_mover, game.rand_pos()) / PLAYS_PER_BOT
+            if prof is not None:
+                prof.start('play')
+            genome.fitness += play(counting_mover) / PLAYS_PER_BOT
+            if prof is not None:
+                prof.stop()
+
+def game_seeds(genome_id, generation, base_seed=EVAL_SEED):
+    """
+    Returns the seeds of the games a genome plays in a generation. They depend only on the arguments, so fitnesses
+    don't depend on how genomes are split between workers.
+    """
+    return np.random.SeedSequence([base_seed, generation, genome_id]).generate_state(PLAYS_PER_BOT)
 
-def run_neat(config_file):
+
+def eval_genome(genome, config, seeds, spec=None):
+    """
+    Returns the average score of a genome over games with the given seeds
+    :param spec: engine.BoardSpec of the board to play on; defaults to BoardSpec.get()
+    """
+    return play_genome(genome, config, seeds, spec)[0]
+
+
+def play_genome(genome, config, seeds, spec=None):
+    """
+    Plays a genome's games with the given seeds
+    :param spec: engine.BoardSpec of the board to play on; defaults to BoardSpec.get()
+    :return: (average score, total game steps)
+    """
+    prof = profiling.profiler
+    if prof is not None:
+        prof.start_genome(genome.key)
+        prof.start('network.create')
+    model = CompiledNetwork.create(genome, config, network_cache)
+    if prof is not None:
+        prof.stop()
+    bot_mover = bot_mover_maker(model)
+    env = SnakeEnv(spec=spec)
+    score = steps = 0
+    for seed in seeds:
+        env.reset(int(seed))
+        if prof is not None:
+            prof.start('play')
+        score += env.run(bot_mover)
+        if prof is not None:
+            prof.stop()
+        steps += env.steps
+    return score / len(seeds), steps
+
+
+def _eval_worker(task):
+    genome, seeds, spec = task
+    return play_genome(genome, worker.config, seeds, spec)
+
+
+class PoolEvaluator():
+    """
+    Evaluates genomes on a pool of worker processes that live for the whole run.
+
+    Pass evaluate() to neat.Population.run in place of train_generation.
+    """
+    def __init__(self, config, workers=None, base_seed=EVAL_SEED, spec=None):
+        """
+        :param config: NEAT config, sent to each worker once
+        :param workers: number of worker processes; defaults to the number of CPUs
+        :param base_seed: seed that all game seeds are derived from
+        :param spec: engine.BoardSpec of the boards to play on; defaults to BoardSpec.get()
+        """
+        self.pool = multiprocessing.Pool(workers, initializer=worker.init_config, initargs=(config,))
+        self.base_seed = base_seed
+        self.spec = BoardSpec.get() if spec is None else spec
+        self.generation = 0
+        # game steps played in the last generation
+        self.steps_played = 0
+
+    def eval_genomes(self, genomes, seeds, specs=None):
+        """
+        Returns the (fitness, game steps) of each genome over games with the matching seeds in :seeds:
+        :param specs: engine.BoardSpec of each genome's boards, so one call can mix board sizes; defaults to self.spec
+        """
+        specs = [self.spec] * len(genomes) if specs is None else specs
+        return self.pool.map(_eval_worker, list(zip(genomes, seeds, specs)))
+
+    def evaluate(self, genomes, config):
+        """
+        Computes fitnesses of given genomes
+        """
+        seeds = [game_seeds(genome_id, self.generation, self.base_seed) for genome_id, genome in genomes]
+        self.steps_played = 0
+        for (genome_id, genome), (fitness, steps) in zip(genomes, self.eval_genomes([g for _, g in genomes], seeds)):
+            genome.fitness = fitness
+            self.steps_played += steps
+        self.generation += 1
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def seed_set(version=SEED_SET_VERSION, n_games=PLAYS_PER_BOT):
+    """
+    Returns the fixed seeds of the games every genome plays in seeded evaluation
+    """
+    return tuple(int(seed) for seed in np.random.SeedSequence([EVAL_SEED, version]).generate_state(n_games))
+
+
+def genome_hash(genome):
+    """
+    Returns a hash of everything in a genome that affects its network, so identical genomes hash the same
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for key in sorted(genome.nodes):
+        ng = genome.nodes[key]
+        h.update(repr((key, ng.bias, ng.response, ng.activation, ng.aggregation)).encode())
+    for key in sorted(genome.connections):
+        cg = genome.connections[key]
+        if cg.enabled:
+            h.update(repr((key, cg.weight)).encode())
+    return h.hexdigest()
+
+
+class FitnessCache(LRUCache):
+    """
+    Least-recently-used cache of fitnesses
+    """
+    def __init__(self, maxsize=1000):
+        super().__init__(maxsize)
+
+
+class SeededEvaluator():
+    """
+    Plays every genome on the same fixed set of seeds, so a genome's fitness never changes. Fitnesses are cached by
+    genome hash, so elites and duplicate genomes aren't replayed.
+
+    Pass evaluate() to neat.Population.run in place of train_generation.
+    """
+    def __init__(self, seed_version=SEED_SET_VERSION, cache_size=1000, pool=None):
+        """
+        :param seed_version: version of the seed set to play
+        :param cache_size: number of fitnesses to remember
+        :param pool: PoolEvaluator to play games on; None plays them in this process
+        """
+        self.seeds = seed_set(seed_version)
+        self.cache = FitnessCache(cache_size)
+        self.pool = pool
+        # game steps played in the last generation; cached genomes play none
+        self.steps_played = 0
+
+    def evaluate(self, genomes, config):
+        """
+        Computes fitnesses of given genomes
+        """
+        # genomes that need to be played, grouped by cache key
+        todo = collections.OrderedDict()
+        for genome_id, genome in genomes:
+            key = (genome_hash(genome), self.seeds)
+            fitness = self.cache.get(key)
+            if fitness is None:
+                todo.setdefault(key, []).append(genome)
+            else:
+                genome.fitness = fitness
+
+        to_play = [same[0] for same in todo.values()]
+        if self.pool is None:
+            results = [play_genome(genome, config, self.seeds) for genome in to_play]
+        else:
+            results = self.pool.eval_genomes(to_play, [self.seeds] * len(to_play))
+
+        self.steps_played = 0
+        for (key, same), (fitness, steps) in zip(todo.items(), results):
+            self.steps_played += steps
+            self.cache.put(key, fitness)
+            for genome in same:
+                genome.fitness = fitness
+
+
+class AdaptiveEvaluator():
+    """
+    Spends a generation's games on the genomes that matter for selection.
+
+    Every genome first plays :initial_plays: games. After that, each round gives one more game to every genome
+    whose confidence interval reaches the top of the population (the :top_k:-th best lower bound), until no genome
+    qualifies, they've all played :max_plays: games, or the generation's step budget runs out. Genomes that die
+    early or clearly trail the best ones are left with their cheap first estimate. Rounds also stop when every
+    qualifying genome has the same games and mean score (as when they all score 0, common early on), since there's
+    nothing to tell them apart by.
+
+    Pass evaluate() to neat.Population.run in place of train_generation.
+    """
+    def __init__(self, initial_plays=1, max_plays=PLAYS_PER_BOT, top_k=10, z=1.96, min_std=1.0, step_budget=None,
+                 base_seed=EVAL_SEED):
+        """
+        :param initial_plays: games every genome plays
+        :param max_plays: most games any genome plays
+        :param top_k: how many of the best genomes count as the top of the population
+        :param z: width of the confidence intervals, in standard errors
+        :param min_std: least standard deviation of a genome's scores assumed, in points, so genomes whose games
+            happened to score the same don't get zero-width intervals
+        :param step_budget: most game steps to play per generation beyond the initial games; None for no limit
+        :param base_seed: seed that all game seeds are derived from
+        """
+        self.initial_plays = initial_plays
+        self.max_plays = max_plays
+        self.top_k = top_k
+        self.z = z
+        self.min_std = min_std
+        self.step_budget = step_budget
+        self.base_seed = base_seed
+        self.generation = 0
+
+        # games and steps played in the last generation
+        self.games_played = 0
+        self.steps_played = 0
+
+    def evaluate(self, genomes, config):
+        """
+        Computes fitnesses of given genomes
+        """
+        movers = [bot_mover_maker(CompiledNetwork.create(genome, config, network_cache))
+                  for genome_id, genome in genomes]
+        seeds = [np.random.SeedSequence([self.base_seed, self.generation, genome_id]).generate_state(self.max_plays)
+                 for genome_id, genome in genomes]
+        scores = [[] for _ in genomes]
+        env = SnakeEnv()
+        self.games_played = self.steps_played = 0
+
+        def play_next(i):
+            env.reset(int(seeds[i][len(scores[i])]))
+            scores[i].append(env.run(movers[i]))
+            self.games_played += 1
+            self.steps_played += env.steps
+            return env.steps
+
+        for i in range(len(genomes)):
+            for _ in range(self.initial_plays):
+                play_next(i)
+
+        # spread of single-game scores, for genomes with too few games to estimate their own
+        pooled_std = np.std([score for s in scores for score in s])
+        budget = np.inf if self.step_budget is None else self.step_budget
+        while budget > 0:
+            n = np.array([len(s) for s in scores])
+            means = np.array([np.mean(s) for s in scores])
+            stds = np.array([np.std(s, ddof=1) if len(s) > 1 else pooled_std for s in scores])
+            stds = np.maximum(stds, self.min_std)
+            half_width = self.z * stds / np.sqrt(n)
+
+            top = np.sort(means - half_width)[-min(self.top_k, len(genomes))]
+            candidates = np.flatnonzero((means + half_width >= top) & (n < self.max_plays))
+            tied = len(candidates) > 1 and np.ptp(means[candidates]) == 0 and np.ptp(n[candidates]) == 0
+            if not len(candidates) or tied:
+                break
+            for i in candidates[np.argsort(-(means + half_width)[candidates], kind='stable')]:
+                budget -= play_next(i)
+                if budget <= 0:
+                    break
+
+        for (genome_id, genome), s in zip(genomes, scores):
+            genome.fitness = float(np.mean(s))
+        self.generation += 1
+
+
+def play_lockstep(population, seeds, spec=None):
+    """
+    Plays every network's games together, one step of all live games at a time. Each step activates every live
+    game's network in one PopulationNetwork pass; games that end drop out of the batch.
+    :param population: fastnet.PopulationNetwork
+    :param seeds: (P, G) seeds of the games each network plays
+    :param spec: engine.BoardSpec of the boards to play on; defaults to BoardSpec.get()
+    :return: (P, G) scores and steps of the games, the same as playing each game with bot_mover_maker and SnakeEnv
+    """
+    seeds = np.asarray(seeds)
+    n_nets, n_plays = seeds.shape
+    env = BatchSnakeEnv(seeds.size, spec, auto_reset=False)
+    env.reset_games(np.arange(seeds.size), seeds.ravel())
+    # network playing each game
+    game_net = np.repeat(np.arange(n_nets), n_plays)
+
+    actions = np.zeros(seeds.size, dtype=np.int64)
+    live = np.arange(seeds.size)
+    nets = population.subset(game_net)
+    while len(live):
+        states = local_states(env.grid[live], env.head[live], env.food[live], env.spec)
+        actions[live] = np.argmax(nets.activate(states), axis=1)
+        if env.step(actions).any():
+            live = np.flatnonzero(~env.done)
+            nets = population.subset(game_net[live])
+    return env.score.reshape(n_nets, n_plays), env.steps.reshape(n_nets, n_plays)
+
+
+class LockstepEvaluator():
+    """
+    Plays the whole population's games in lockstep, activating every live game's network together each step
+    instead of calling one network per game. Genomes play the same seeds as with PoolEvaluator, so they get the same
+    fitnesses.
+
+    Pass evaluate() to neat.Population.run in place of train_generation.
+    """
+    def __init__(self, base_seed=EVAL_SEED, spec=None):
+        """
+        :param base_seed: seed that all game seeds are derived from
+        :param spec: engine.BoardSpec of the boards to play on; defaults to BoardSpec.get()
+        """
+        self.base_seed = base_seed
+        self.spec = spec
+        self.generation = 0
+        # game steps played in the last generation
+        self.steps_played = 0
+
+    def evaluate(self, genomes, config):
+        """
+        Computes fitnesses of given genomes
+        """
+        population = PopulationNetwork([CompiledNetwork.create(genome, config, network_cache)
+                                        for genome_id, genome in genomes])
+        seeds = [game_seeds(genome_id, self.generation, self.base_seed) for genome_id, genome in genomes]
+        scores, steps = play_lockstep(population, seeds, self.spec)
+        self.steps_played = int(steps.sum())
+        for (genome_id, genome), s in zip(genomes, scores):
+            genome.fitness = float(np.mean(s))
+        self.generation += 1
+
+
+def run_neat(config_file, workers=1, seeded=False, adaptive=False, lockstep=False, listen=None, authkey=None,
+             resume=None, profile=False):
     """
     runs the NEAT algorithm to train a neural network to play Snake
     :param config_file: location of config file
+    :param workers: number of processes evaluating genomes; with 1, training runs in this process and can be watched
+    :param seeded: whether to score every genome on the same fixed seeds, caching fitnesses (see SeededEvaluator)
+    :param adaptive: whether to give extra games only to the genomes competing for the top (see AdaptiveEvaluator);
+        adaptive evaluation runs in this process
+    :param lockstep: whether to play all genomes' games together, batching their networks (see LockstepEvaluator);
+        lockstep evaluation runs in this process
+    :param listen: (host, port) to listen on for workers started with distributed.py, which evaluate the genomes
+        in place of a local pool; :workers: local workers are started too if it's more than 1
+    :param authkey: key the workers must know to connect (bytes)
+    :param resume: checkpoint saved by reporting.IncrementalCheckpointer to continue training from
+    :param profile: whether to time the phases of evaluations run in this process, printing a breakdown each
+        generation (see reporting.ProfileReporter)
     :return: None
     """
+    import neat
+    from halloffame import HallOfFame
+    from reporting import HallOfFameReporter, IncrementalCheckpointer, ProfileReporter, StreamingReporter
     config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction,
                                 neat.DefaultSpeciesSet, neat.DefaultStagnation,
                                 config_file)
 
     # Create the population, which is the top-level object for a NEAT run.
-    p = neat.Population(config)
+    if resume is None:
+        p = neat.Population(config)
+    else:
+        p = IncrementalCheckpointer.restore_checkpoint(resume)
 
-    # Add a stdout reporter to show progress in the terminal.
-    p.add_reporter(neat.StdOutReporter(True))
-    stats = neat.StatisticsReporter()
-    p.add_reporter(stats)
-    p.add_reporter(neat.Checkpointer(50))
+    if listen is not None:
+        from distributed import DistributedEvaluator
+        pool = DistributedEvaluator(config, listen, authkey)
+        if workers > 1:
+            pool.start_local_workers(workers)
+        print('Listening for workers on {}:{}'.format(*pool.address))
+    elif workers > 1 and not (adaptive or lockstep):
+        pool = PoolEvaluator(config, workers)
+    else:
+        pool = None
+    if adaptive:
+        fitness_function = AdaptiveEvaluator().evaluate
+    elif lockstep:
+        fitness_function = LockstepEvaluator().evaluate
+    elif seeded:
+        fitness_function = SeededEvaluator(pool=pool).evaluate
+    elif pool is not None:
+        fitness_function = pool.evaluate
+    else:
+        # Setings to watch training; games are drawn on the renderer's thread, so evaluation runs at full speed
+        game.USE_FRAMERATE = False
+        game.WATCH = True
+        fitness_function = train_generation
 
-    # Setings to watch training
-    game.USE_FRAMERATE = True
-    game.FRAMERATE = 100
-    game.WATCH = True
+    # Evaluators that seed games by generation carry on from the checkpoint's
+    evaluator = getattr(fitness_function, '__self__', fitness_function)
+    if hasattr(evaluator, 'generation'):
+        evaluator.generation = p.generation
+
+    # Add a stdout reporter to show progress in the terminal, and stream stats, checkpoints and each generation's
+    # champion to disk.
+    p.add_reporter(neat.StdOutReporter(True))
+    p.add_reporter(StreamingReporter(evaluator=evaluator))
+    p.add_reporter(IncrementalCheckpointer(50, last_generation_checkpoint=-1 if resume is None else p.generation))
+    p.add_reporter(HallOfFameReporter(HallOfFame()))
+    if profile:
+        p.add_reporter(ProfileReporter(profiling.enable()))
 
     # Run for up to 1000 generations.
-    winner = p.run(train_generation, 1000)
+    winner = p.run(fitness_function, 1000)
+
+    if pool is not None:
+        pool.close()
 
     # save best genome to file
     pickle.dump(winner, open('best_genome', 'wb'))
@@ -0,0 +1,257 @@
+"""
+Evaluates genomes on worker processes that connect to the trainer over sockets
+
+The trainer runs a DistributedEvaluator, which listens for workers. Workers can be local processes
+(start_local_workers) or run on other hosts:
+
+    python distributed.py HOST:PORT --authkey KEY
+
+Each worker receives the NEAT config once and then batches of (genome, seeds, board spec) to play, and returns their
+fitnesses and game steps. A batch that isn't answered within the timeout, or whose worker disconnects, is sent to
+another worker; a batch that fails too many times stops training with an error. Messages are pickled, so only give
+the authkey to trusted hosts.
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener, wait
+
+import bot
+from engine import BoardSpec
+
+# genomes sent to a worker at once
+BATCH_SIZE = 10
+# seconds a worker has to return a batch before it's sent to another worker
+BATCH_TIMEOUT = 60
+# times a batch is sent out before giving up on it
+MAX_TRIES = 3
+# seconds a worker keeps trying to reach the trainer
+CONNECT_TIMEOUT = 30
+
+
+class DistributedEvaluator():
+    """
+    Evaluates genomes on the workers connected to it. It can stand in for a PoolEvaluator anywhere.
+
+    Pass evaluate() to neat.Population.run in place of train_generation.
+    """
+    def __init__(self, config, address=('localhost', 0), authkey=None, batch_size=BATCH_SIZE,
+                 timeout=BATCH_TIMEOUT, max_tries=MAX_TRIES, base_seed=bot.EVAL_SEED, spec=None):
+        """
+        :param config: NEAT config, sent to each worker once
+        :param address: (host, port) to listen on; port 0 picks a free one, see self.address
+        :param authkey: key workers must know to connect; defaults to a random one, for local workers
+        :param batch_size: genomes sent to a worker at once
+        :param timeout: seconds a worker has to return a batch before it's sent to another worker
+        :param max_tries: failed tries (timeouts or lost workers) a batch gets before giving up on it
+        :param base_seed: seed that all game seeds are derived from
+        :param spec: engine.BoardSpec of the boards to play on; defaults to BoardSpec.get()
+        """
+        self.config = config
+        self.authkey = os.urandom(16) if authkey is None else authkey
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.max_tries = max_tries
+        self.base_seed = base_seed
+        self.spec = BoardSpec.get() if spec is None else spec
+        self.generation = 0
+        # game steps played in the last generation
+        self.steps_played = 0
+
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+        # workers that have connected but aren't being used yet
+        self.new_workers = []
+        self.lock = threading.Lock()
+        self.closed = False
+        self.local_workers = []
+        threading.Thread(target=self.accept_workers, daemon=True).start()
+
+        # batches sent out again after a timeout or a lost worker
+        self.retries = 0
+
+    def accept_workers(self):
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+                conn.send(('config', self.config))
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                # closed, or a worker that failed to authenticate or hung up
+                continue
+            with self.lock:
+                self.new_workers.append(conn)
+
+    def start_local_workers(self, n):
+        """
+        Start :n: worker processes on this machine
+        """
+        for _ in range(n):
+            process = multiprocessing.Process(target=run_worker, args=(self.address, self.authkey), daemon=True)
+            process.start()
+            self.local_workers.append(process)
+
+    def eval_genomes(self, genomes, seeds, specs=None):
+        """
+        Returns the (fitness, game steps) of each genome over games with the matching seeds in :seeds:
+        :param specs: engine.BoardSpec of each genome's boards, so one call can mix board sizes; defaults to self.spec
+        """
+        specs = [self.spec] * len(genomes) if specs is None else specs
+        tasks = list(zip(genomes, seeds, specs))
+        batches = [tasks[i:i + self.batch_size] for i in range(0, len(tasks), self.batch_size)]
+        results = [None] * len(batches)
+        # timeouts and lost workers of each batch
+        failures = [0] * len(batches)
+        todo = list(range(len(batches)))
+        # connection -> [batch index, time sent, whether it timed out] of busy workers
+        busy = {}
+        idle = []
+        last_worker = time.monotonic()
+
+        def fail(batch):
+            failures[batch] += 1
+            if failures[batch] >= self.max_tries:
+                raise RuntimeError('batch of {} genomes failed {} times'.format(len(batches[batch]), failures[batch]))
+            if batch not in todo:
+                todo.append(batch)
+                self.retries += 1
+
+        while any(result is None for result in results):
+            with self.lock:
+                idle += self.new_workers
+                self.new_workers = []
+            now = time.monotonic()
+            # workers past their timeout don't count, so hung workers can't keep training waiting forever
+            if idle or any(now - sent <= self.timeout for batch, sent, timed_out in busy.values()):
+                last_worker = now
+            elif now - last_worker > self.timeout:
+                raise RuntimeError('no responsive workers connected to {}'.format(self.address))
+
+            # a worker running past its timeout counts as a failed try of its batch, which is sent out again
+            for state in busy.values():
+                batch, sent, timed_out = state
+                if results[batch] is None and not timed_out and now - sent > self.timeout:
+                    state[2] = True
+                    fail(batch)
+
+            # hand out batches, skipping any answered by a straggler in the meantime
+            todo[:] = [batch for batch in todo if results[batch] is None]
+            while todo and idle:
+                batch = todo[0]
+                conn = idle.pop()
+                try:
+                    conn.send(('batch', batch, batches[batch]))
+                except (OSError, EOFError):
+                    conn.close()
+                    continue
+                todo.pop(0)
+                busy[conn] = [batch, time.monotonic(), False]
+
+            for conn in wait(list(busy), timeout=0.1):
+                batch, sent, timed_out = busy.pop(conn)
+                try:
+                    message, batch, batch_results = conn.recv()
+                except (OSError, EOFError):
+                    # lost the worker; send its batch to another one, unless its timeout already did
+                    conn.close()
+                    if results[batch] is None and not timed_out:
+                        fail(batch)
+                    continue
+                if results[batch] is None:
+                    results[batch] = batch_results
+                idle.append(conn)
+
+        # workers still busy with a batch that was already answered keep it, and rejoin once they send it back
+        with self.lock:
+            self.new_workers += idle
+        threading.Thread(target=self.drain, args=(list(busy),), daemon=True).start()
+        return [pair for result in results for pair in result]
+
+    def drain(self, conns):
+        """
+        Wait for straggling workers to return their stale batches, then make them available again
+        """
+        for conn in conns:
+            try:
+                conn.recv()
+            except (OSError, EOFError):
+                conn.close()
+                continue
+            with self.lock:
+                self.new_workers.append(conn)
+
+    def evaluate(self, genomes, config):
+        """
+        Computes fitnesses of given genomes
+        """
+        seeds = [bot.game_seeds(genome_id, self.generation, self.base_seed) for genome_id, genome in genomes]
+        self.steps_played = 0
+        for (genome_id, genome), (fitness, steps) in zip(genomes, self.eval_genomes([g for _, g in genomes], seeds)):
+            genome.fitness = fitness
+            self.steps_played += steps
+        self.generation += 1
+
+    def close(self):
+        """
+        Tell the workers to stop and stop listening
+        """
+        self.closed = True
+        with self.lock:
+            workers, self.new_workers = self.new_workers, []
+        for conn in workers:
+            try:
+                conn.send(('stop',))
+            except (OSError, EOFError):
+                pass
+            conn.close()
+        self.listener.close()
+        for process in self.local_workers:
+            process.join(timeout=5)
+
+
+def run_worker(address, authkey, connect_timeout=CONNECT_TIMEOUT):
+    """
+    Evaluates batches of genomes for the trainer at :address: until it stops
+    :param address: (host, port) the trainer's DistributedEvaluator listens on
+    :param authkey: the trainer's authkey
+    :param connect_timeout: seconds to keep trying to reach the trainer
+    """
+    give_up = time.monotonic() + connect_timeout
+    while True:
+        try:
+            conn = Client(tuple(address), authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > give_up:
+                raise
+            time.sleep(0.5)
+
+    config = None
+    with conn:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return
+            if message[0] == 'config':
+                config = message[1]
+            elif message[0] == 'batch':
+                batch, tasks = message[1:]
+                results = [bot.play_genome(genome, config, seeds, spec) for genome, seeds, spec in tasks]
+                conn.send(('result', batch, results))
+            elif message[0] == 'stop':
+                return
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate genomes for a trainer running a DistributedEvaluator')
+    parser.add_argument('address', help="the trainer's HOST:PORT")
+    parser.add_argument('--authkey', default=os.environ.get('SNAKE_AUTHKEY'),
+                        help="the trainer's authkey; defaults to $SNAKE_AUTHKEY")
+    args = parser.parse_args()
+    if not args.authkey:
+        parser.error('an authkey is required')
+
+    host, port = args.address.rsplit(':', 1)
+    run_worker((host, int(port)), args.authkey.encode())
@@ -0,0 +1,370 @@
+"""
+Headless Snake engine with no PyGame dependency
+
+game.play and the renderer are thin layers on top of SnakeEnv, so training only pays for the game logic.
+"""
+from collections import deque
+import numpy as np
+import profiling
+
+# board played when no BoardSpec is given
+GRID_SIZE = 16
+# pixels per cell when the board is drawn
+BLOCK_SIZE = 25
+# width and height of the square around the head the bot sees
+VISION_BOX = 5
+
+# steps allowed between foods before the game times out
+MAX_SEARCH_LENGTH = 100
+
+# tries a custom food controller gets to find a free cell before the food is placed at random
+MAX_FOOD_TRIES = 100
+
+# empty border around the board in Snake.grid, so cells just outside the board can be looked up too
+GRID_PAD = 2
+
+# action indices, in the order of the bot's network outputs
+UP, RIGHT, DOWN, LEFT = range(4)
+# (dx, dy) of each action
+MOVES = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+# cell reached by moving off the board, in BoardSpec.neighbours
+WALL = -1
+
+# seeded games draw their random numbers from SplitMix64 streams; see draw
+MASK64 = (1 << 64) - 1
+GOLDEN = 0x9E3779B97F4A7C15
+
+
+def mix64(x):
+    """
+    SplitMix64's finalizer: hashes a 64 bit int, or each element of a uint64 array, to a well-spread 64 bit value
+    """
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & MASK64
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & MASK64
+    return x ^ (x >> 31)
+
+
+def stream_key(seed):
+    """
+    Returns the key of a seeded game's random stream; takes an int, or an array of seeds as uint64
+    """
+    return mix64(seed & MASK64)
+
+
+def draw(key, count, n):
+    """
+    Returns draw :count: of the stream with :key: as an int in [0, n). Each draw is a hash of the key and its
+    count, so the draws of many games are made at once by passing uint64 arrays of keys, counts and n.
+    """
+    x = mix64((key + (count + 1) * GOLDEN) & MASK64)
+    return (x >> 32) * n >> 32
+
+
+class BoardSpec():
+    """
+    Size of a board and how it's seen and drawn, with lookup tables precomputed for it. Get specs from
+    BoardSpec.get, so the tables for each board are only built once and shared; a pickled spec unpickles to the
+    shared one too, so only its settings are sent to other processes. Cells are numbered y * grid_size + x.
+        neighbours: (cells, 4) cell reached from each cell by each action, or WALL
+        walls: padded grid that is 1 outside the board, indexed [y + GRID_PAD, x + GRID_PAD] like Snake.grid
+        vision: (cells, vision_box ** 2 - 1) indices into a flattened padded grid of the cells around each cell
+            (all but the cell itself, in row-major order)
+        vision_walls: (cells, vision_box ** 2 - 1) whether each of those cells is outside the board
+        padded: (cells,) index of each cell in a flattened padded grid
+    """
+    def __init__(self, grid_size=GRID_SIZE, vision_box=VISION_BOX, block_size=BLOCK_SIZE):
+        """
+        :param grid_size: width and height of the board
+        :param vision_box: width and height of the square around the head the bot sees
+        :param block_size: pixels per cell when the board is drawn
+        """
+        radius = range(-vision_box // 2 + 1, vision_box // 2 + 1)
+        if max(-radius[0], radius[-1]) > GRID_PAD:
+            raise ValueError("vision_box can see at most {} cells from the head".format(GRID_PAD))
+
+        self.grid_size = grid_size
+        self.vision_box = vision_box
+        self.block_size = block_size
+        self.screen_size = block_size * grid_size
+        self.n_cells = grid_size * grid_size
+
+        y, x = np.divmod(np.arange(self.n_cells), grid_size)
+        self.neighbours = np.full((self.n_cells, 4), WALL, dtype=np.int64)
+        for action, (dx, dy) in enumerate(MOVES):
+            nx, ny = x + dx, y + dy
+            inside = (nx >= 0) & (nx < grid_size) & (ny >= 0) & (ny < grid_size)
+            self.neighbours[inside, action] = (ny * grid_size + nx)[inside]
+
+        width = grid_size + 2 * GRID_PAD
+        self.walls = np.ones((width, width), dtype=np.int8)
+        self.walls[GRID_PAD:-GRID_PAD, GRID_PAD:-GRID_PAD] = 0
+
+        self.padded = (y + GRID_PAD) * width + x + GRID_PAD
+        offsets = np.array([i * width + j for i in radius for j in radius if i != 0 or j != 0], dtype=np.int64)
+        self.vision = self.padded[:, None] + offsets
+        self.vision_walls = self.walls.ravel()[self.vision]
+
+    @staticmethod
+    def get(grid_size=None, vision_box=None, block_size=None):
+        """
+        Returns the shared spec for the given settings. Settings left out are GRID_SIZE, VISION_BOX and BLOCK_SIZE,
+        the default board every game is played on.
+        """
+        key = (GRID_SIZE if grid_size is None else grid_size,
+               VISION_BOX if vision_box is None else vision_box,
+               BLOCK_SIZE if block_size is None else block_size)
+        spec = _specs.get(key)
+        if spec is None:
+            spec = _specs[key] = BoardSpec(*key)
+        return spec
+
+    def __reduce__(self):
+        return BoardSpec.get, (self.grid_size, self.vision_box, self.block_size)
+
+    def cell(self, pos):
+        """
+        Returns the number of the cell at :pos:, which must be on the board
+        """
+        return pos[1] * self.grid_size + pos[0]
+
+    def on_board(self, pos):
+        """
+        Returns whether :pos:, which must be on the board or at most GRID_PAD cells outside it, is on the board
+        """
+        return not self.walls[pos[1] + GRID_PAD, pos[0] + GRID_PAD]
+
+
+# (grid_size, vision_box, block_size) -> shared BoardSpec; see BoardSpec.get
+_specs = {}
+
+
+class SeededRandom():
+    """
+    Random state of a seeded game, with the randint calls SnakeEnv makes. Draws come from draw(), so BatchSnakeEnv
+    plays the same games without keeping a random state per game.
+    """
+    def __init__(self, seed):
+        self.key = stream_key(int(seed))
+        # draws made so far
+        self.count = 0
+
+    def randint(self, low, high=None, size=None):
+        """
+        Returns a random int in [low, high), or [0, low) without :high:, or an array of :size: of them
+        """
+        if high is None:
+            low, high = 0, low
+        if size is not None:
+            return np.array([self.randint(low, high) for _ in range(size)])
+        value = low + draw(self.key, self.count, high - low)
+        self.count += 1
+        return value
+
+
+class Food():
+    def __init__(self, pos):
+        self.pos = tuple(pos)
+
+    def respawn(self, func):
+        """
+        Respawn the food in a new place
+        """
+        new_pos = tuple(func())
+        self.pos = new_pos
+
+
+class Snake():
+    def __init__(self, pos, spec=None):
+        """
+        :param pos: position of the snake's only block
+        :param spec: BoardSpec of the board; defaults to BoardSpec.get()
+        """
+        self.spec = BoardSpec.get() if spec is None else spec
+        self.dir = self.right
+        self.blocks = deque([tuple(pos)])
+
+        # how many blocks cover each cell, indexed [y + GRID_PAD, x + GRID_PAD]
+        self.grid = np.zeros(self.spec.walls.shape, dtype=np.int8)
+        self.grid[pos[1] + GRID_PAD, pos[0] + GRID_PAD] = 1
+
+        # whether the next move keeps the tail in place
+        self.growing = False
+        # whether the last move put the head on the snake's body
+        self.hit_self = False
+
+        # direction functions indexed by action
+        self.moves = (self.up, self.right, self.down, self.left)
+
+    def occupies(self, pos):
+        """
+        Return whether the snake covers :pos:, which must be on the board or at most GRID_PAD cells outside it
+        """
+        return self.grid[pos[1] + GRID_PAD, pos[0] + GRID_PAD] > 0
+
+    def free_cells(self):
+        """
+        Return the indices (y * grid_size + x) of the board cells the snake doesn't cover, in increasing order
+        """
+        return np.flatnonzero(self.grid[GRID_PAD:-GRID_PAD, GRID_PAD:-GRID_PAD].ravel() == 0)
+
+    def grow(self):
+        """
+        Grow the snake by one block on its next move
+        """
+        self.growing = True
+
+    def move(self):
+        """
+        Move the snake in direction indicated by self.dir
+        """
+        new = self.dir(self.blocks[0])
+        if self.growing:
+            self.growing = False
+        else:
+            tail = self.blocks.pop()
+            self.grid[tail[1] + GRID_PAD, tail[0] + GRID_PAD] -= 1
+
+        self.hit_self = self.occupies(new)
+        self.blocks.appendleft(new)
+        self.grid[new[1] + GRID_PAD, new[0] + GRID_PAD] += 1
+
+    ## Direction functions; move head of snake left, right, up, or down
+    def left(self, head):
+        return (head[0] - 1, head[1])
+    def right(self, head):
+        return (head[0] + 1, head[1])
+    def up(self, head):
+        return (head[0], head[1] - 1)
+    def down(self, head):
+        return (head[0], head[1] + 1)
+
+
+class SnakeEnv():
+    """
+    One game of Snake. Call reset() to start a game.
+
+    Each call to step() matches one iteration of the original game loop: the snake eats the food under its head
+    (if any), moves, and the game ends on a timeout, on leaving the board or on hitting itself.
+    """
+    def __init__(self, food_controller=None, spec=None, recorder=None):
+        """
+        :param food_controller: function that returns the next food position when called; defaults to a random
+            position drawn from the environment's own random state
+        :param spec: BoardSpec of the board; defaults to BoardSpec.get()
+        :param recorder: replay.Recorder that records every game played
+        """
+        self.food_controller = food_controller
+        self.spec = BoardSpec.get() if spec is None else spec
+        self.grid_size = self.spec.grid_size
+        self.recorder = recorder
+
+    def rand_pos(self):
+        """
+        Return a random tuple with values between 0 and grid_size
+        """
+        return self.rng.randint(0, self.grid_size, size=2)
+
+    def reset(self, seed=None):
+        """
+        Start a new game
+        :param seed: seed for the game's random state (a SeededRandom); None uses the global NumPy random state
+        :return: (snake, food)
+        """
+        self.seed = seed
+        self.rng = np.random if seed is None else SeededRandom(seed)
+
+        self.snake = Snake(self.rand_pos(), self.spec)
+        self.food = Food(self.rand_pos())
+
+        self.score = 0
+        self.steps = 0
+        self.search_length = 0
+        self.done = False
+        self.death_cause = None
+        if self.recorder is not None:
+            self.recorder.start(self)
+        return self.snake, self.food
+
+    def spawn_food(self):
+        """
+        Respawn the food somewhere not covered by the snake. Positions from a custom food controller are used if it
+        finds a free cell within MAX_FOOD_TRIES tries; otherwise a free cell is picked at random.
+        :return: False if the snake covers the whole board, so there's nowhere to put the food
+        """
+        if self.food_controller is not None:
+            for _ in range(MAX_FOOD_TRIES):
+                self.food.respawn(self.food_controller)
+                if not self.snake.occupies(self.food.pos):
+                    return True
+
+        free = self.snake.free_cells()
+        if not len(free):
+            return False
+        cell = free[self.rng.randint(len(free))]
+        self.food.pos = (int(cell % self.grid_size), int(cell // self.grid_size))
+        return True
+
+    def step(self, action=None):
+        """
+        Advance the game by one move
+        :param action: UP, RIGHT, DOWN or LEFT; None keeps the direction already set on the snake
+        :return: True if the game is over
+        """
+        snake = self.snake
+        if action is not None:
+            snake.dir = snake.moves[action]
+        elif self.recorder is not None:
+            action = snake.moves.index(snake.dir)
+
+        # check if snake ate food
+        ate = snake.blocks[0] == self.food.pos
+        if ate:
+            self.search_length = 0
+            self.score += 1
+            if not self.spawn_food():
+                self.death_cause = 'board full'
+                self.done = True
+                if self.recorder is not None:
+                    self.recorder.record(action, ate, self)
+                return self.done
+            snake.grow()
+
+        snake.move()
+        self.search_length += 1
+        self.steps += 1
+
+        head = snake.blocks[0]
+        if self.search_length > MAX_SEARCH_LENGTH:
+            self.death_cause = 'timeout'
+        elif not self.spec.on_board(head):
+            self.death_cause = 'out map'
+        elif snake.hit_self:
+            self.death_cause = 'hit snake'
+        self.done = self.death_cause is not None
+        if self.recorder is not None:
+            self.recorder.record(action, ate, self)
+        return self.done
+
+    def run(self, snake_controller):
+        """
+        Play the current game to the end without rendering
+        :param snake_controller: function with args (snake, food) that sets the snake's direction
+        :return: score (# of foods eaten)
+        """
+        prof = profiling.profiler
+        if prof is None:
+            while not self.done:
+                snake_controller(self.snake, self.food)
+                self.step()
+            return self.score
+
+        while not self.done:
+            prof.start('controller')
+            snake_controller(self.snake, self.food)
+            prof.stop()
+            prof.start('engine.step')
+            self.step()
+            prof.stop()
+        prof.game_over(self)
+        return self.score
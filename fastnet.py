@@ -0,0 +1,356 @@
+"""
+Compiles NEAT genomes into networks evaluated with NumPy matrix operations
+
+CompiledNetwork gives the same outputs as neat.nn.FeedForwardNetwork, but evaluates a whole layer of nodes with one
+matrix product and can activate a batch of states at once. A NetworkCache reuses the layout of networks with the
+same topology, so recompiling a genome whose weights changed skips the graph analysis. PopulationNetwork stacks many
+compiled networks so a whole population is activated together.
+"""
+import collections
+import numpy as np
+from lru import LRUCache
+
+# layouts a NetworkCache keeps
+NETWORK_CACHE_SIZE = 1024
+
+# flat records of a genome's nodes and connections, as genome_arrays makes them and CompiledNetwork.from_arrays reads
+NODE_DTYPE = np.dtype([('key', '<i8'), ('bias', '<f8'), ('response', '<f8'),
+                       ('activation', 'S16'), ('aggregation', 'S16')])
+CONNECTION_DTYPE = np.dtype([('in', '<i8'), ('out', '<i8'), ('weight', '<f8'), ('enabled', '?')])
+# the genes CompiledNetwork.from_arrays builds networks from
+NodeGene = collections.namedtuple('NodeGene', 'bias response activation aggregation')
+ConnectionGene = collections.namedtuple('ConnectionGene', 'weight enabled')
+
+# NumPy versions of neat's built-in activation functions
+ACTIVATIONS = {
+    'sigmoid': lambda z: 1.0 / (1.0 + np.exp(-np.clip(5.0 * z, -60.0, 60.0))),
+    # tanh already saturates long before neat's clamp at +-60
+    'tanh': lambda z: np.tanh(2.5 * z),
+    'sin': lambda z: np.sin(np.clip(5.0 * z, -60.0, 60.0)),
+    'gauss': lambda z: np.exp(-5.0 * np.clip(z, -3.4, 3.4) ** 2),
+    'relu': lambda z: np.maximum(z, 0.0),
+    'softplus': lambda z: 0.2 * np.log(1 + np.exp(np.clip(5.0 * z, -60.0, 60.0))),
+    'identity': lambda z: z,
+    'clamped': lambda z: np.clip(z, -1.0, 1.0),
+    'log': lambda z: np.log(np.maximum(z, 1e-7)),
+    'exp': lambda z: np.exp(np.clip(z, -60.0, 60.0)),
+    'abs': np.abs,
+    'hat': lambda z: np.maximum(0.0, 1 - np.abs(z)),
+    'square': lambda z: z ** 2,
+    'cube': lambda z: z ** 3,
+}
+
+
+def activation_function(name, config):
+    """
+    Returns a NumPy activation function for the given activation name, wrapping neat's scalar version if there's
+    no NumPy one
+    :param config: NEAT config with the scalar versions; None if only NumPy versions may be used
+    """
+    if name in ACTIVATIONS:
+        return ACTIVATIONS[name]
+    if config is None:
+        raise ValueError("No NumPy version of activation {!r}; pass the NEAT config".format(name))
+    return np.vectorize(config.genome_config.activation_defs.get(name), otypes=[float])
+
+
+class Layer():
+    """
+    Nodes of a network that can be evaluated together.
+
+    The layer reads the value slots in :src:, and writes slots dst_start to dst_start + len(bias). Its weight
+    matrix only has rows for the slots that feed it, so it stays small even when the network is large.
+    """
+    def __init__(self, src, weights, bias, response, dst_start, activations):
+        """
+        :param src: (S,) value slots read by the layer
+        :param weights: (S, K) weights from each source slot to each node
+        :param bias: (K,) node biases
+        :param response: (K,) node responses
+        :param dst_start: first value slot written by the layer
+        :param activations: list of (activation function, node indices) pairs
+        """
+        self.src = src
+        self.weights = weights
+        self.bias = bias
+        self.response = response
+        self.dst = slice(dst_start, dst_start + len(bias))
+        self.activations = activations
+
+    def activate(self, values):
+        """
+        Computes the layer's nodes for a (n_slots,) or (B, n_slots) array of values, in place
+        """
+        z = self.bias + self.response * (values[..., self.src] @ self.weights)
+        if len(self.activations) == 1:
+            values[..., self.dst] = self.activations[0][0](z)
+        else:
+            out = values[..., self.dst]
+            for func, nodes in self.activations:
+                out[..., nodes] = func(z[..., nodes])
+
+
+class CompiledNetwork():
+    """
+    Feed-forward network evaluated layer by layer with NumPy.
+
+    Values are stored in slots: the inputs first, then every evaluated node in layer order. Output nodes that neat
+    never evaluates (because they don't connect back to the inputs) get a slot that stays 0, as in neat.
+    """
+    def __init__(self, n_inputs, n_slots, layers, output_slots):
+        self.n_inputs = n_inputs
+        self.n_slots = n_slots
+        self.layers = layers
+        self.output_slots = np.asarray(output_slots)
+
+    def activate(self, inputs):
+        """
+        Activates the network
+        :param inputs: (n_inputs,) state, or (B, n_inputs) batch of states
+        :return: (n_outputs,) or (B, n_outputs) array of outputs
+        """
+        inputs = np.asarray(inputs, dtype=float)
+        if inputs.shape[-1] != self.n_inputs:
+            raise RuntimeError("Expected {0:n} inputs, got {1:n}".format(self.n_inputs, inputs.shape[-1]))
+
+        values = np.zeros(inputs.shape[:-1] + (self.n_slots,))
+        values[..., :self.n_inputs] = inputs
+        for layer in self.layers:
+            layer.activate(values)
+        return values[..., self.output_slots]
+
+    @staticmethod
+    def create(genome, config, cache=None):
+        """
+        Receives a genome and returns its phenotype, with the same layers as neat.nn.FeedForwardNetwork.create
+        :param cache: NetworkCache to reuse the layout of genomes with the same topology from
+        """
+        if cache is not None:
+            return cache.create(genome, config)
+        genome_config = config.genome_config
+        return CompiledNetwork.build(genome_config.input_keys, genome_config.output_keys, genome.nodes,
+                                     genome.connections, config)
+
+    @staticmethod
+    def from_arrays(n_inputs, n_outputs, nodes, connections, config=None):
+        """
+        Returns the phenotype of a genome stored as flat arrays by genome_arrays, without needing the genome
+        :param n_inputs: number of network inputs, keyed -1 to -n_inputs as in neat
+        :param n_outputs: number of network outputs, keyed 0 to n_outputs - 1 as in neat
+        :param nodes: array of NODE_DTYPE records
+        :param connections: array of CONNECTION_DTYPE records
+        :param config: NEAT config, only needed for activation functions with no NumPy version
+        """
+        node_genes = {key: NodeGene(bias, response, activation.decode(), aggregation.decode())
+                      for key, bias, response, activation, aggregation in nodes.tolist()}
+        connection_genes = {(inode, onode): ConnectionGene(weight, enabled)
+                            for inode, onode, weight, enabled in connections.tolist()}
+        return CompiledNetwork.build([-i - 1 for i in range(n_inputs)], list(range(n_outputs)), node_genes,
+                                     connection_genes, config)
+
+    @staticmethod
+    def build(input_keys, output_keys, nodes, connections, config=None):
+        """
+        Compiles a network from its genes
+        :param nodes: dict of node key -> gene with bias, response, activation and aggregation, such as genome.nodes
+        :param connections: dict of (input key, output key) -> gene with weight and enabled, such as
+            genome.connections
+        :param config: NEAT config, only needed for activation functions with no NumPy version
+        """
+        return NetworkLayout(input_keys, output_keys, nodes, connections, config).network(nodes, connections)
+
+
+class NetworkLayout():
+    """
+    Everything about a compiled network that depends only on its topology: the nodes of each layer, the slots they
+    read and write, their activation functions, and where each connection's weight goes in its layer's weight
+    matrix. network() fills in the weights, biases and responses of any genome with the same topology.
+    """
+    def __init__(self, input_keys, output_keys, nodes, connections, config=None):
+        """
+        Takes the same arguments as CompiledNetwork.build
+        """
+        # neat is only needed once there are genomes to compile, which also means it's already loaded
+        from neat.graphs import feed_forward_layers
+
+        # Gather expressed connections.
+        enabled = [key for key, cg in connections.items() if cg.enabled]
+        incoming = {}
+        for inode, onode in enabled:
+            incoming.setdefault(onode, []).append(inode)
+
+        slots = {key: i for i, key in enumerate(input_keys)}
+        # (node keys, connection keys, src, (rows, cols) of the connections' weights, dst_start, activations)
+        self.layers = []
+        for layer_nodes in feed_forward_layers(input_keys, output_keys, enabled):
+            layer_nodes = sorted(layer_nodes)
+            dst_start = len(slots)
+
+            src = sorted({slots[inode] for node in layer_nodes for inode in incoming[node]})
+            src_row = {slot: row for row, slot in enumerate(src)}
+            layer_connections = [(inode, node) for node in layer_nodes for inode in incoming[node]]
+            rows = np.array([src_row[slots[inode]] for inode, node in layer_connections], dtype=int)
+            cols = np.array([col for col, node in enumerate(layer_nodes) for inode in incoming[node]], dtype=int)
+
+            activations = {}
+            for col, node in enumerate(layer_nodes):
+                ng = nodes[node]
+                if ng.aggregation != 'sum':
+                    raise ValueError("Only sum aggregation can be compiled, got {!r}".format(ng.aggregation))
+                activations.setdefault(ng.activation, []).append(col)
+
+            self.layers.append((layer_nodes, layer_connections, np.array(src, dtype=int), (rows, cols), dst_start,
+                                [(activation_function(name, config), np.array(cols))
+                                 for name, cols in activations.items()]))
+            for node in layer_nodes:
+                slots[node] = len(slots)
+
+        # outputs that are never evaluated read an extra slot that stays 0
+        for key in output_keys:
+            if key not in slots:
+                slots[key] = len(slots)
+
+        self.n_inputs = len(input_keys)
+        self.n_slots = len(slots)
+        self.output_slots = [slots[key] for key in output_keys]
+
+    def network(self, nodes, connections):
+        """
+        Returns the CompiledNetwork of genes with this layout's topology
+        :param nodes: dict of node key -> gene with bias and response
+        :param connections: dict of (input key, output key) -> gene with weight
+        """
+        layers = []
+        for layer_nodes, layer_connections, src, positions, dst_start, activations in self.layers:
+            weights = np.zeros((len(src), len(layer_nodes)))
+            weights[positions] = [connections[key].weight for key in layer_connections]
+            layers.append(Layer(src, weights,
+                                np.array([nodes[node].bias for node in layer_nodes]),
+                                np.array([nodes[node].response for node in layer_nodes]),
+                                dst_start, activations))
+        return CompiledNetwork(self.n_inputs, self.n_slots, layers, self.output_slots)
+
+
+class NetworkCache(LRUCache):
+    """
+    Least-recently-used table of NetworkLayouts by topology, so compiling a genome whose nodes (with their
+    activation and aggregation functions) and enabled connections match a recent one only fills in its weights,
+    biases and responses. Across generations that covers elites and most offspring, whose mutations mostly
+    perturb weights.
+    """
+    def __init__(self, maxsize=NETWORK_CACHE_SIZE):
+        super().__init__(maxsize)
+
+    @staticmethod
+    def topology(genome):
+        """
+        Returns a key that's the same for genomes that compile to the same layout
+        """
+        return (frozenset((key, ng.activation, ng.aggregation) for key, ng in genome.nodes.items()),
+                frozenset(key for key, cg in genome.connections.items() if cg.enabled))
+
+    def create(self, genome, config):
+        """
+        Returns the CompiledNetwork of :genome:, the same as CompiledNetwork.create without a cache
+        """
+        key = self.topology(genome)
+        layout = self.get(key)
+        if layout is None:
+            genome_config = config.genome_config
+            layout = NetworkLayout(genome_config.input_keys, genome_config.output_keys, genome.nodes,
+                                   genome.connections, config)
+            self.put(key, layout)
+        return layout.network(genome.nodes, genome.connections)
+
+
+def genome_arrays(genome):
+    """
+    Returns a genome's nodes and connections as flat arrays of NODE_DTYPE and CONNECTION_DTYPE records, which
+    CompiledNetwork.from_arrays compiles without the genome
+    """
+    names = {name for ng in genome.nodes.values() for name in (ng.activation, ng.aggregation)}
+    if max(map(len, names), default=0) > NODE_DTYPE['activation'].itemsize:
+        raise ValueError("Function names are limited to {} characters".format(NODE_DTYPE['activation'].itemsize))
+    nodes = np.array([(key, ng.bias, ng.response, ng.activation, ng.aggregation)
+                      for key, ng in genome.nodes.items()], dtype=NODE_DTYPE)
+    connections = np.array([cg.key + (cg.weight, cg.enabled) for cg in genome.connections.values()],
+                           dtype=CONNECTION_DTYPE)
+    return nodes, connections
+
+
+class PopulationNetwork():
+    """
+    Many compiled networks stacked into padded arrays, so a whole population is activated with a few matrix
+    operations.
+
+    Network p's layers are merged into one (n_slots, n_slots) matrix W[p]. Applying it as many times as the deepest
+    network has layers evaluates every node of every network, since each pass fixes at least one more layer.
+    """
+    def __init__(self, networks):
+        """
+        :param networks: list of CompiledNetwork objects with the same numbers of inputs and outputs
+        """
+        n_inputs = networks[0].n_inputs
+        n_slots = max(net.n_slots for net in networks)
+        n_nets = len(networks)
+
+        self.n_inputs = n_inputs
+        self.n_slots = n_slots
+        self.depths = np.array([len(net.layers) for net in networks])
+        self.depth = self.depths.max()
+        self.weights = np.zeros((n_nets, n_slots, n_slots))
+        self.bias = np.zeros((n_nets, n_slots))
+        self.response = np.zeros((n_nets, n_slots))
+        self.output_slots = np.array([net.output_slots for net in networks])
+
+        # slots of each network that are evaluated, grouped by activation function
+        self.activations = {}
+        for p, net in enumerate(networks):
+            for layer in net.layers:
+                dst = np.arange(layer.dst.start, layer.dst.stop)
+                self.weights[p][np.ix_(layer.src, dst)] = layer.weights
+                self.bias[p, dst] = layer.bias
+                self.response[p, dst] = layer.response
+                for func, nodes in layer.activations:
+                    mask = self.activations.setdefault(func, np.zeros((n_nets, n_slots), dtype=bool))
+                    mask[p, dst[nodes]] = True
+
+    def subset(self, index):
+        """
+        Returns a PopulationNetwork of only the networks in :index:, which may repeat networks. Its depth is that of
+        its deepest network, so dropping deep networks makes it quicker to activate.
+        """
+        index = np.asarray(index, dtype=int)
+        net = PopulationNetwork.__new__(PopulationNetwork)
+        net.n_inputs = self.n_inputs
+        net.n_slots = self.n_slots
+        net.depths = self.depths[index]
+        net.depth = net.depths.max(initial=0)
+        net.weights = self.weights[index]
+        net.bias = self.bias[index]
+        net.response = self.response[index]
+        net.output_slots = self.output_slots[index]
+        net.activations = {func: mask[index] for func, mask in self.activations.items()}
+        return net
+
+    def activate(self, inputs):
+        """
+        Activates every network
+        :param inputs: (P, n_inputs) array with one state per network, or (P, B, n_inputs) with a batch of states
+            per network
+        :return: (P, n_outputs) or (P, B, n_outputs) array of outputs
+        """
+        inputs = np.asarray(inputs, dtype=float)
+        batch = inputs.reshape(len(inputs), -1, self.n_inputs)
+
+        values = np.zeros(batch.shape[:2] + (self.n_slots,))
+        values[:, :, :self.n_inputs] = batch
+        bias, response = self.bias[:, None], self.response[:, None]
+        for _ in range(self.depth):
+            z = bias + response * np.matmul(values, self.weights)
+            for func, mask in self.activations.items():
+                mask = np.broadcast_to(mask[:, None], values.shape)
+                values[mask] = func(z[mask])
+
+        outputs = np.take_along_axis(values, self.output_slots[:, None], axis=2)
+        return outputs[:, 0] if inputs.ndim == 2 else outputs
@@ -1,22 +1,12 @@
 """
 Code for running Snake using PyGame
+
+PyGame is only imported once a game is watched, played by a human or run at a limited framerate, so headless games
+and tools that just need the helpers here start quickly.
 """
-import pygame
 import numpy as np
-from pygame.locals import (
-    K_w,
-    K_a,
-    K_s,
-    K_d,
-    KEYDOWN,
-    QUIT,
-    K_ESCAPE
-)
-
-# board
-BLOCK_SIZE = 25
-GRID_SIZE = 16
-SCREEN_SIZE = BLOCK_SIZE * GRID_SIZE
+import profiling
+from engine import BoardSpec, Food, Snake, SnakeEnv
 
 # observation settings
 FRAMERATE = 10
@@ -24,157 +14,103 @@ USE_FRAMERATE = True
 WATCH = True
 SHOW_DEATH_CAUSE = False
 
-class Food():
-    def __init__(self, pos):
-        self.pos = tuple(pos)
-
-    def draw(self, screen):
-        """
-        Draws the food with a border
-        """
-        border = 5
-        real_pos = np.multiply(self.pos, BLOCK_SIZE)
-        pygame.draw.rect(screen, (150, 0, 0), (*real_pos, BLOCK_SIZE, BLOCK_SIZE))
-        pygame.draw.rect(screen, (255, 0, 0),
-                         (real_pos[0] + border, real_pos[1] + border, BLOCK_SIZE - 2 * border, BLOCK_SIZE - 2 * border))
-
-    def respawn(self, func):
-        """
-        Respawn the food in a new place
-        """
-        new_pos = tuple(func())
-        self.pos = new_pos
-
-
-class Snake():
-    def __init__(self, pos):
-        self.dir = self.right
-        self.blocks = [tuple(pos)]
-
+# draws watched games on its own thread; see get_renderer
+renderer = None
 
-    def draw(self, screen):
-        """
-        Draws each block of the snake with a border
-        """
-        border = 5
-        for pos in self.blocks:
-            real_pos = np.multiply(pos, BLOCK_SIZE)
-            pygame.draw.rect(screen, (0, 150, 0), (*real_pos, BLOCK_SIZE, BLOCK_SIZE))
-            pygame.draw.rect(screen, (0, 255, 0), (real_pos[0] + border, real_pos[1] + border, BLOCK_SIZE - 2 * border, BLOCK_SIZE - 2 * border))
-
-    def move(self):
-        """
-        Move the snake in direction indicated by self.dir
-        """
-        new = self.dir(self.blocks[0])
-        self.blocks.insert(0, new)
-        self.blocks.pop()
-
-
-    ## Direction functions; move head of snake left, right, up, or down
-    def left(self, head):
-        return (head[0] - 1, head[1])
-    def right(self, head):
-        return (head[0] + 1, head[1])
-    def up(self, head):
-        return (head[0], head[1] - 1)
-    def down(self, head):
-        return (head[0], head[1] + 1)
+def get_renderer(spec=None):
+    """
+    Returns the renderer that draws watched games, starting it the first time and again when the board's size changes
+    :param spec: BoardSpec of the board to draw; defaults to BoardSpec.get()
+    """
+    global renderer
+    spec = BoardSpec.get() if spec is None else spec
+    if renderer is not None and (renderer.block_size, renderer.screen_size) != (spec.block_size, spec.screen_size):
+        renderer.stop()
+        renderer = None
+    if renderer is None:
+        from render import ThreadedRenderer
+        renderer = ThreadedRenderer(spec.block_size, spec.grid_size)
+        renderer.start()
+    return renderer
 
 
 def rand_pos():
     """
-    Return a random tuple with values between 0 and GRID_SIZE
+    Return a random position on the default board
     """
-    return np.random.randint(0, GRID_SIZE, size=2)
+    return np.random.randint(0, BoardSpec.get().grid_size, size=2)
 
 def human_mover(snake, food):
+    import pygame
     presses = pygame.key.get_pressed()
-    if presses[K_w]:
+    if presses[pygame.K_w]:
         snake.dir = snake.up
-    elif presses[K_s]:
+    elif presses[pygame.K_s]:
         snake.dir = snake.down
-    elif presses[K_a]:
+    elif presses[pygame.K_a]:
         snake.dir = snake.left
-    elif presses[K_d]:
+    elif presses[pygame.K_d]:
         snake.dir = snake.right
 
-def play(snake_controller, food_controller):
+def play(snake_controller, food_controller=None, seed=None, recorder=None, spec=None):
     """
     Plays Snake using given
     :param snake_controller: function that, given current state, returns the direction to move the snake
-    :param food controller: function that returns the next food position when called.
+    :param food controller: function that returns the next food position when called; defaults to random positions
+    :param seed: seed for the game's random state; None uses the global NumPy random state
+    :param recorder: replay.Recorder to record the game into
+    :param spec: engine.BoardSpec of the board; defaults to BoardSpec.get()
     :return: score (# of foods eaten)
     """
-    # PyGame setup
-    pygame.init()
-    screen = pygame.display.set_mode([SCREEN_SIZE, SCREEN_SIZE])
-    clock = pygame.time.Clock()
-
-    # Game objects setup
-    snake = Snake(rand_pos())
-    food = Food(rand_pos())
-
+    spec = BoardSpec.get() if spec is None else spec
+    env = SnakeEnv(food_controller, spec, recorder)
+    snake, food = env.reset(seed)
+
+    # Watched games are drawn on the renderer's thread, which also handles the window's events
+    if WATCH:
+        view = get_renderer(spec)
+        view.new_game()
+        view.submit(snake, food)
+    if USE_FRAMERATE:
+        import pygame
+        pygame.init()
+        clock = pygame.time.Clock()
+
+    # phases are timed only when profiling is on
+    prof = profiling.profiler
 
-    score = 0
-    search_length = 0
-
-    done = False
-    while not done:
+    while True:
         # Quit if escape / X pressed
-        for event in pygame.event.get():
-            if event.type == KEYDOWN:
-                if event.key == K_ESCAPE:
-                    done = True
-            elif event.type == QUIT:
-                done = True
-
-        # Draw board if user wants to watch
-        if WATCH:
-            screen.fill((0, 0, 0))
-            snake.draw(screen)
-            food.draw(screen)
-            pygame.display.flip()
-
-        # Quit if snake takes too long to find the food
-        if search_length > 100:
-            if SHOW_DEATH_CAUSE:
-                print('timeout')
-            break
-
-        # quit if snake hits border
-        if not 0 <= snake.blocks[0][0] < GRID_SIZE or not 0 <= snake.blocks[0][1] < GRID_SIZE:
-            if SHOW_DEATH_CAUSE:
-                print('out map')
+        if WATCH and view.quit_requested():
             break
 
         # move snake
+        if prof is not None:
+            prof.start('controller')
         snake_controller(snake, food)
-
-        # check if snake hit itself
-        if snake.blocks[0] in snake.blocks[1:]:
+        if prof is not None:
+            prof.stop()
+            prof.start('engine.step')
+        done = env.step()
+        if prof is not None:
+            prof.stop()
+        if WATCH:
+            if prof is not None:
+                prof.start('render.submit')
+            view.submit(snake, food)
+            if prof is not None:
+                prof.stop()
+        if done:
             if SHOW_DEATH_CAUSE:
-                print('hit snake')
+                print(env.death_cause)
             break
 
-        # check if snake ate food
-        if snake.blocks[0] == food.pos:
-            search_length = 0
-            score += 1
-            food.respawn(food_controller)
-            while food.pos in snake.blocks:
-                food.respawn(food_controller)
-            snake.blocks.append(snake.blocks[0])
-
-        # Move snake
-        snake.move()
-
         if USE_FRAMERATE:
             clock.tick(FRAMERATE)
 
-        search_length += 1
-
-    return score
+    if prof is not None:
+        prof.game_over(env)
+    return env.score
 
 if __name__ == '__main__':
     FRAMERATE = 10
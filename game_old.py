@@ -1,6 +1,7 @@
 import pygame
 import neat
 import numpy as np
+from spatial import GridIndex
 
 from pygame.locals import (
     K_UP,
@@ -28,21 +29,19 @@ N_LIVES = 5
 RELOAD_RATE = 30
 BULLET_SPEED = 5
 TANK_SPEED = 1
+# most pixels a bullet's rect reaches from its center
+BULLET_MARGIN = 2
 
 
-def closest(this, sprites):
-    min_dist = float("inf")
-    closest_pt = (0, 0)
-    vector = (0, 0)
-    this_pt = this.rect.center
-    for sprite in sprites:
-        point = sprite.rect.center
-        dist = np.sqrt((this_pt[0]-point[0])**2 + (this_pt[1]-point[1])**2)
-        if dist < min_dist and this.id != sprite.id:
-            closest_pt = point
-            min_dist = dist
-            vector = sprite.vector
-    return list(closest_pt) + list(vector)
+def closest(this, index):
+    """
+    Returns the position and vector of the sprite in spatial.GridIndex :index: closest to :this:, ignoring sprites
+    with this sprite's id
+    """
+    sprite = index.nearest(this.rect.center, this.id)
+    if sprite is None:
+        return [0, 0, 0, 0]
+    return list(sprite.rect.center) + list(sprite.vector)
 
 def magnitude(vector):
     return np.sqrt(vector[0] ** 2 + vector[1] ** 2)
@@ -147,8 +146,8 @@ class AI_Tank(Tank):
         self.model = model
         self.genome = genome
 
-    def eval(self, tanks_all, bullets):
-        closest_tank, closest_bullet = closest(self, tanks_all), closest(self, bullets)
+    def eval(self, tank_index, bullet_index):
+        closest_tank, closest_bullet = closest(self, tank_index), closest(self, bullet_index)
         inputs = np.concatenate((self.rect.center, np.subtract(closest_tank[:2], self.rect.center), closest_tank[2:], np.subtract(closest_bullet[:2], self.rect.center), closest_bullet[2:]))
 
         guess = self.model.activate(inputs)
@@ -157,8 +156,8 @@ class AI_Tank(Tank):
 
         return tank_vector, bullet_vector
 
-    def act(self, tanks_all, bullets):
-        tank_vector, bullet_vector = self.eval(tanks_all, bullets)
+    def act(self, tank_index, bullet_index):
+        tank_vector, bullet_vector = self.eval(tank_index, bullet_index)
 
         self.move(*tank_vector)
         return self.fire_bullet(bullet_vector)
@@ -206,6 +205,11 @@ def play(genomes, config):
 
     bullets = pygame.sprite.Group()
 
+    # spatial indexes of the live tanks and bullets, kept up to date as they move
+    tank_index, bullet_index = GridIndex(), GridIndex()
+    for tank in tanks_all:
+        tank_index.add(tank)
+
     pygame.init()
 
     screen = pygame.display.set_mode([SCREEN_SIZE, SCREEN_SIZE])
@@ -237,6 +241,7 @@ def play(genomes, config):
                     bullet = list(tanks_h)[0].fire_bullet(mouse_pos)
                     if bullet:
                         bullets.add(bullet)
+                        bullet_index.add(bullet)
 
 
         screen.fill((255, 255, 255))
@@ -245,24 +250,31 @@ def play(genomes, config):
         # draw + move tanks
         for tank in tanks_all:
             border_pass(tank)
+            tank_index.update(tank)
             if type(tank) == Tank:
                 tank.keyboard_move(presses)
                 tank.reload()
             elif type(tank) == AI_Tank:
-                bullet = tank.act(tanks_all, bullets)
+                bullet = tank.act(tank_index, bullet_index)
                 if bullet:
                     bullets.add(bullet)
+                    bullet_index.add(bullet)
                 tank.reload()
-            for bullet in bullets:
-                if pygame.sprite.collide_rect(tank, bullet) and tank.id != bullet.owner:
+            tank_index.update(tank)
+            for bullet in bullet_index.colliding(tank.rect, BULLET_MARGIN):
+                if tank.id != bullet.owner:
                     bullet.kill()
+                    bullet_index.remove(bullet)
                     tank.hurt(tanks_all)
+                    if not tank.alive():
+                        tank_index.remove(tank)
                     tank_id_map[bullet.owner].lives += 1
                     # tank_id_map[bullet.owner].genome.fitness += HIT_BONUS
             screen.blit(tank.surf, tank.rect)
 
         for bullet in bullets:
             bullet.move()
+            bullet_index.update(bullet)
             # border_pass(bullet)
 
             screen.blit(bullet.surf, bullet.rect)
@@ -322,7 +334,8 @@ def run_neat(config_file):
 
 # print(play([], None))
 
-run_neat('config-feedforward.txt')
+if __name__ == '__main__':
+    run_neat('config-feedforward.txt')
 
 
 
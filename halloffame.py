@@ -0,0 +1,165 @@
+"""
+Append-only archive of champion genomes, stored as flat arrays in memory-mapped files
+
+Each genome's nodes and connections are written as fastnet.NODE_DTYPE and CONNECTION_DTYPE records to a data file,
+and a fixed-size entry for it (generation, key, fitness, structural hash and where its records are) to an index file.
+Entry i is at a known position in the index, so any champion is found in O(1), and its network is compiled straight
+from the mapped arrays, without unpickling anything:
+
+    hof = HallOfFame('halloffame')
+    model = hof.network(hof.best()[0])
+
+Records are appended before their entry, so a run stopped mid-write leaves at most unreferenced records behind,
+and a partly written entry is ignored and then overwritten by the next one.
+"""
+import hashlib
+import os
+import numpy as np
+from fastnet import CONNECTION_DTYPE, NODE_DTYPE, CompiledNetwork, genome_arrays
+
+MAGIC = b'SNKH'
+VERSION = 1
+# magic and version, padded to 8 bytes, at the start of both files
+HEADER = MAGIC + bytes([VERSION, 0, 0, 0])
+
+ENTRY_DTYPE = np.dtype([('generation', '<i4'), ('key', '<i8'), ('fitness', '<f8'), ('topology', '<u8'),
+                        ('offset', '<i8'), ('n_nodes', '<i4'), ('n_connections', '<i4'),
+                        ('n_inputs', '<i4'), ('n_outputs', '<i4')])
+
+
+def topology_hash(nodes, connections):
+    """
+    Returns a 64 bit hash of a genome's structure: its node keys and the keys of its enabled connections
+    :param nodes: array of fastnet.NODE_DTYPE records
+    :param connections: array of fastnet.CONNECTION_DTYPE records
+    """
+    h = hashlib.blake2b(digest_size=8)
+    h.update(np.sort(nodes['key']).astype('<i8').tobytes())
+    enabled = connections[connections['enabled']]
+    h.update(np.unique(np.stack((enabled['in'], enabled['out']), axis=1), axis=0).astype('<i8').tobytes())
+    return int.from_bytes(h.digest(), 'little')
+
+
+class HallOfFame():
+    """
+    Archive of genomes in :directory:, as index.bin (an array of ENTRY_DTYPE entries) and genomes.bin (each
+    genome's node records followed by its connection records)
+    """
+    def __init__(self, directory='halloffame'):
+        self.directory = directory
+        self.index_file = os.path.join(directory, 'index.bin')
+        self.data_file = os.path.join(directory, 'genomes.bin')
+        os.makedirs(directory, exist_ok=True)
+        for filename in (self.index_file, self.data_file):
+            if not os.path.exists(filename):
+                with open(filename, 'wb') as f:
+                    f.write(HEADER)
+            with open(filename, 'rb') as f:
+                if f.read(len(HEADER)) != HEADER:
+                    raise ValueError('{} is not a version {} hall of fame file'.format(filename, VERSION))
+        self._entries = None
+        self._data = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def entries(self):
+        """
+        Read-only memory-mapped array of every genome's ENTRY_DTYPE entry, in the order they were added
+        """
+        if self._entries is None:
+            n = (os.path.getsize(self.index_file) - len(HEADER)) // ENTRY_DTYPE.itemsize
+            self._entries = (np.memmap(self.index_file, ENTRY_DTYPE, 'r', len(HEADER), (n,)) if n
+                             else np.zeros(0, ENTRY_DTYPE))
+        return self._entries
+
+    def add(self, genome, config, generation):
+        """
+        Append a genome to the archive
+        :param generation: generation the genome is a champion of
+        :return: the genome's entry number
+        """
+        nodes, connections = genome_arrays(genome)
+        entry = np.zeros(1, ENTRY_DTYPE)
+        entry['generation'] = generation
+        entry['key'] = genome.key
+        entry['fitness'] = np.nan if genome.fitness is None else genome.fitness
+        entry['topology'] = topology_hash(nodes, connections)
+        entry['n_nodes'] = len(nodes)
+        entry['n_connections'] = len(connections)
+        entry['n_inputs'] = config.genome_config.num_inputs
+        entry['n_outputs'] = config.genome_config.num_outputs
+
+        with open(self.data_file, 'ab') as f:
+            entry['offset'] = f.tell()
+            f.write(nodes.tobytes())
+            f.write(connections.tobytes())
+        with open(self.index_file, 'r+b') as f:
+            # overwrite any partly written entry
+            f.seek(len(HEADER) + len(self.entries) * ENTRY_DTYPE.itemsize)
+            f.write(entry.tobytes())
+            f.truncate()
+
+        # remap on the next read, to see the new entry
+        self._entries = self._data = None
+        return len(self.entries) - 1
+
+    def arrays(self, i):
+        """
+        Returns read-only views of entry :i:'s node and connection records
+        """
+        entry = self.entries[i]
+        if self._data is None:
+            self._data = np.memmap(self.data_file, np.uint8, 'r')
+        start = int(entry['offset'])
+        middle = start + int(entry['n_nodes']) * NODE_DTYPE.itemsize
+        end = middle + int(entry['n_connections']) * CONNECTION_DTYPE.itemsize
+        return self._data[start:middle].view(NODE_DTYPE), self._data[middle:end].view(CONNECTION_DTYPE)
+
+    def network(self, i, config=None):
+        """
+        Returns entry :i:'s fastnet.CompiledNetwork
+        :param config: NEAT config, only needed for activation functions with no NumPy version
+        """
+        entry = self.entries[i]
+        return CompiledNetwork.from_arrays(int(entry['n_inputs']), int(entry['n_outputs']), *self.arrays(i), config)
+
+    def genome(self, i, config):
+        """
+        Returns entry :i: as a genome of :config:'s genome type, to seed a population or evaluate like any other
+        """
+        entry = self.entries[i]
+        nodes, connections = self.arrays(i)
+        genome_config = config.genome_config
+        genome = config.genome_type(int(entry['key']))
+        for key, bias, response, activation, aggregation in nodes.tolist():
+            ng = genome_config.node_gene_type(key)
+            ng.bias, ng.response = bias, response
+            ng.activation, ng.aggregation = activation.decode(), aggregation.decode()
+            genome.nodes[key] = ng
+        for inode, onode, weight, enabled in connections.tolist():
+            cg = genome_config.connection_gene_type((inode, onode))
+            cg.weight, cg.enabled = weight, enabled
+            genome.connections[cg.key] = cg
+        genome.fitness = None if np.isnan(entry['fitness']) else float(entry['fitness'])
+        return genome
+
+    def best(self, n=1):
+        """
+        Returns the entry numbers of the :n: fittest genomes, fittest first
+        """
+        fitness = np.nan_to_num(self.entries['fitness'], nan=-np.inf)
+        return np.argsort(-fitness, kind='stable')[:n]
+
+    def generation(self, generation):
+        """
+        Returns the entry numbers of the genomes added for :generation:
+        """
+        return np.flatnonzero(self.entries['generation'] == generation)
+
+    def with_topology(self, topology):
+        """
+        Returns the entry numbers of the genomes whose topology_hash is :topology:
+        """
+        return np.flatnonzero(self.entries['topology'] == np.uint64(topology))
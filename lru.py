@@ -0,0 +1,49 @@
+"""
+Least-recently-used cache that the training loop's memo tables are built on
+
+fastnet.NetworkCache, bot.PolicyMemo and bot.FitnessCache each keep recent values in an LRUCache, so they share one
+eviction policy and the same hit, miss and eviction counters.
+"""
+import collections
+
+
+class LRUCache():
+    """
+    Table of at most :maxsize: values, dropping the least recently used one when it's full. A maxsize of 0 stores
+    nothing.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key):
+        """
+        Returns the value stored for :key:, or None
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if not self.maxsize:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,119 @@
+"""
+Opt-in timers and counters for the phases of training
+
+Call enable() to start profiling; until then `profiler` is None and the instrumented code skips all of it. The
+game loops check it once per game and the bot movers once when they're made, so disabled profiling costs next to
+nothing.
+
+Timed phases nest, and each one is charged only for the time not spent in the phases inside it, so the totals
+can be written out as collapsed stacks (one "outer;inner;phase microseconds" line per stack) for flamegraph.pl or
+speedscope.
+"""
+import collections
+import time
+
+# the active Profiler, or None when profiling is off
+profiler = None
+
+
+def enable():
+    """
+    Start profiling with a new Profiler
+    :return: the Profiler
+    """
+    global profiler
+    profiler = Profiler()
+    return profiler
+
+
+def disable():
+    global profiler
+    profiler = None
+
+
+class Profiler():
+    """
+    Phase timers, plus the steps and death causes of the games played by each genome
+    """
+    def __init__(self):
+        # current stack of [phase, start time, time spent in inner phases]
+        self.stack = []
+        # stack of phase names -> seconds spent in the innermost phase itself, over the whole run
+        self.self_times = collections.Counter()
+        self.generation = self.new_generation()
+        self.genome = None
+
+    @staticmethod
+    def new_generation():
+        return {
+            'seconds': collections.Counter(),
+            'calls': collections.Counter(),
+            'steps': 0,
+            'death_causes': collections.Counter(),
+            # genome id -> {'steps': [...], 'scores': [...], 'death_causes': [...]}, one entry per game
+            'genomes': {},
+        }
+
+    def start(self, phase):
+        self.stack.append([phase, time.perf_counter(), 0.0])
+
+    def stop(self):
+        phase, start, inner = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        self.self_times[tuple(frame[0] for frame in self.stack) + (phase,)] += elapsed - inner
+        if self.stack:
+            self.stack[-1][2] += elapsed
+        self.generation['seconds'][phase] += elapsed
+        self.generation['calls'][phase] += 1
+
+    def start_genome(self, genome_id):
+        """
+        Attribute the following games to :genome_id:
+        """
+        self.genome = self.generation['genomes'].setdefault(
+            genome_id, {'steps': [], 'scores': [], 'death_causes': []})
+
+    def game_over(self, env):
+        """
+        Record a finished engine.SnakeEnv game
+        """
+        self.generation['steps'] += env.steps
+        self.generation['death_causes'][env.death_cause] += 1
+        if self.genome is not None:
+            self.genome['steps'].append(env.steps)
+            self.genome['scores'].append(env.score)
+            self.genome['death_causes'].append(env.death_cause)
+
+    def end_generation(self):
+        """
+        Finish the current generation's breakdown and start a new one. Finished breakdowns aren't kept, so hold on to
+        (or stream out, like reporting.ProfileReporter) any that are needed later
+        :return: the finished breakdown
+        """
+        finished = self.generation
+        self.generation = self.new_generation()
+        self.genome = None
+        return finished
+
+    def report(self, breakdown=None):
+        """
+        Returns a table of the time spent in each phase of a generation's breakdown (the current one by default),
+        followed by its steps and death causes
+        """
+        breakdown = self.generation if breakdown is None else breakdown
+        lines = ['{:<20} {:>10} {:>10} {:>12}'.format('phase', 'seconds', 'calls', 'us/call')]
+        for phase, seconds in breakdown['seconds'].most_common():
+            calls = breakdown['calls'][phase]
+            lines.append('{:<20} {:>10.3f} {:>10} {:>12.1f}'.format(phase, seconds, calls, 1e6 * seconds / calls))
+        lines.append('steps: {}'.format(breakdown['steps']))
+        lines.append('death causes: {}'.format(', '.join('{} {}'.format(cause, n) for cause, n in
+                                                         breakdown['death_causes'].most_common())))
+        return '\n'.join(lines)
+
+    def write_collapsed(self, filename):
+        """
+        Write the time spent in each stack of phases as collapsed stacks, in microseconds
+        """
+        with open(filename, 'w') as f:
+            for stack, seconds in sorted(self.self_times.items()):
+                f.write('{} {}\n'.format(';'.join(stack), int(round(seconds * 1e6))))
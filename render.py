@@ -0,0 +1,147 @@
+"""
+Draws Snake games on a background thread
+
+The simulation hands snapshots of the board to a ThreadedRenderer and carries on. The renderer redraws only the cells
+that changed since the last frame it drew, and drops frames that it can't keep up with, so watching a game never
+slows the game down.
+"""
+import queue
+import threading
+import pygame
+from pygame.locals import KEYDOWN, QUIT, K_ESCAPE
+
+# (fill, border) colors of each kind of block
+SNAKE_COLORS = ((0, 150, 0), (0, 255, 0))
+FOOD_COLORS = ((150, 0, 0), (255, 0, 0))
+BACKGROUND = (0, 0, 0)
+BORDER = 5
+
+# most frames drawn per second
+RENDER_FRAMERATE = 60
+
+
+def draw_block(screen, pos, colors, block_size):
+    """
+    Draws one block of the board with a border
+    :return: the rect covered by the block
+    """
+    x, y = pos[0] * block_size, pos[1] * block_size
+    rect = pygame.draw.rect(screen, colors[0], (x, y, block_size, block_size))
+    pygame.draw.rect(screen, colors[1], (x + BORDER, y + BORDER, block_size - 2 * BORDER, block_size - 2 * BORDER))
+    return rect
+
+
+class ThreadedRenderer():
+    """
+    Owns the PyGame window and draws snapshots submitted from the simulation on its own thread. It also pumps the
+    window's events; quit_requested() reports whether escape was pressed or the window was closed.
+
+    Some platforms (notably macOS) only allow windows on the main thread, so this renderer is for Linux and Windows.
+    """
+    def __init__(self, block_size, grid_size, max_queued=2):
+        """
+        :param block_size: size of each block in pixels
+        :param grid_size: width and height of the board in blocks
+        :param max_queued: snapshots to hold before the oldest ones are dropped
+        """
+        self.block_size = block_size
+        self.screen_size = block_size * grid_size
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.quit_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+        self.game_id = 0
+        self.frames_drawn = 0
+        self.frames_dropped = 0
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """
+        Close the window once the queued frames are drawn
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+    def new_game(self):
+        """
+        Start a new game, so its first frame is drawn in full
+        """
+        self.game_id += 1
+
+    def submit(self, snake, food):
+        """
+        Queue a snapshot of the board to be drawn, dropping the oldest queued one if the renderer is behind
+        """
+        frame = (self.game_id, tuple(snake.blocks), tuple(food.pos))
+        while True:
+            try:
+                self.queue.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.frames_dropped += 1
+                except queue.Empty:
+                    pass
+
+    def quit_requested(self):
+        """
+        Return whether the user asked to quit since the last call
+        """
+        if self.quit_event.is_set():
+            self.quit_event.clear()
+            return True
+        return False
+
+    def run(self):
+        pygame.init()
+        screen = pygame.display.set_mode([self.screen_size, self.screen_size])
+        clock = pygame.time.Clock()
+
+        drawn_game = None
+        drawn_cells = set()
+        drawn_food = None
+        while True:
+            for event in pygame.event.get():
+                if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+                    self.quit_event.set()
+
+            try:
+                frame = self.queue.get(timeout=1 / RENDER_FRAMERATE)
+            except queue.Empty:
+                continue
+            if frame is None:
+                break
+            game_id, blocks, food = frame
+            cells = set(blocks)
+
+            if game_id != drawn_game:
+                # draw the whole board for a new game
+                screen.fill(BACKGROUND)
+                for cell in cells:
+                    draw_block(screen, cell, SNAKE_COLORS, self.block_size)
+                draw_block(screen, food, FOOD_COLORS, self.block_size)
+                pygame.display.flip()
+            else:
+                # redraw only the new head, the vacated tail and the food
+                dirty = cells ^ drawn_cells
+                if food != drawn_food:
+                    dirty |= {food, drawn_food}
+                rects = []
+                for cell in dirty:
+                    rect = screen.fill(BACKGROUND, (cell[0] * self.block_size, cell[1] * self.block_size,
+                                                    self.block_size, self.block_size))
+                    if cell in cells:
+                        draw_block(screen, cell, SNAKE_COLORS, self.block_size)
+                    if cell == food:
+                        draw_block(screen, cell, FOOD_COLORS, self.block_size)
+                    rects.append(rect)
+                pygame.display.update(rects)
+
+            drawn_game, drawn_cells, drawn_food = game_id, cells, food
+            self.frames_drawn += 1
+            clock.tick(RENDER_FRAMERATE)
+
+        pygame.display.quit()
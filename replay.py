@@ -0,0 +1,200 @@
+"""
+Compact binary recordings of Snake games, and fast replays of them
+
+A trace stores the game's seed and starting positions, one byte per step (the action and event flags) and the
+position of every food spawned after the first, so a game replays exactly without its network or random state.
+"""
+import struct
+from collections import deque
+import numpy as np
+from engine import GRID_PAD, BoardSpec, Food, Snake, SnakeEnv
+
+MAGIC = b'SNKR'
+VERSION = 1
+# magic, version, grid size, seed (-1 if unseeded), snake x, snake y, food x, food y, death cause, # steps, # foods
+HEADER = struct.Struct('<4sBBqBBBBBII')
+
+# layout of each step byte
+ACTION_MASK = 0b11
+ATE = 1 << 2
+DONE = 1 << 3
+
+DEATH_CAUSES = (None, 'timeout', 'out map', 'hit snake', 'board full')
+
+# steps between the snapshots a Replay keeps for seeking
+KEYFRAME_INTERVAL = 256
+
+
+class Trace():
+    """
+    Recording of one game
+    """
+    def __init__(self, grid_size, seed, snake_start, food_start):
+        self.grid_size = grid_size
+        self.seed = seed
+        self.snake_start = tuple(int(x) for x in snake_start)
+        self.food_start = tuple(int(x) for x in food_start)
+        self.steps = bytearray()
+        self.foods = []
+        self.death_cause = None
+
+    @property
+    def score(self):
+        return sum(1 for step in self.steps if step & ATE)
+
+    def to_bytes(self):
+        header = HEADER.pack(MAGIC, VERSION, self.grid_size, -1 if self.seed is None else int(self.seed),
+                             *self.snake_start, *self.food_start, DEATH_CAUSES.index(self.death_cause),
+                             len(self.steps), len(self.foods))
+        return header + bytes(self.steps) + np.array(self.foods, dtype=np.uint8).tobytes()
+
+    @staticmethod
+    def from_bytes(data):
+        (magic, version, grid_size, seed, snake_x, snake_y, food_x, food_y, death_cause,
+         n_steps, n_foods) = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a version {} Snake trace'.format(VERSION))
+
+        trace = Trace(grid_size, None if seed == -1 else seed, (snake_x, snake_y), (food_x, food_y))
+        trace.death_cause = DEATH_CAUSES[death_cause]
+        start = HEADER.size
+        trace.steps = bytearray(data[start:start + n_steps])
+        foods = np.frombuffer(data, dtype=np.uint8, count=2 * n_foods, offset=start + n_steps)
+        trace.foods = [(int(x), int(y)) for x, y in foods.reshape(-1, 2)]
+        return trace
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return Trace.from_bytes(f.read())
+
+
+class Recorder():
+    """
+    Records the game played by a SnakeEnv; pass one to SnakeEnv or game.play. The trace of the last game is kept
+    in self.trace.
+    """
+    def __init__(self):
+        self.trace = None
+
+    def start(self, env):
+        self.trace = Trace(env.grid_size, env.seed, env.snake.blocks[0], env.food.pos)
+
+    def record(self, action, ate, env):
+        self.trace.steps.append(action | (ATE if ate else 0) | (DONE if env.done else 0))
+        if ate and env.death_cause != 'board full':
+            self.trace.foods.append(tuple(int(x) for x in env.food.pos))
+        if env.done:
+            self.trace.death_cause = env.death_cause
+
+
+class Replay():
+    """
+    Replays a trace by re-running its actions through the game logic, with no network or random state. Snapshots
+    taken every keyframe_interval steps let seek() jump to any step quickly.
+    """
+    def __init__(self, trace, keyframe_interval=KEYFRAME_INTERVAL):
+        self.trace = trace
+        self.keyframe_interval = keyframe_interval
+
+        steps = np.frombuffer(bytes(trace.steps), dtype=np.uint8)
+        self.actions = steps & ACTION_MASK
+        # score before each step, and after the last one
+        self.scores = np.concatenate(([0], np.cumsum((steps & ATE) > 0)))
+
+        self.env = SnakeEnv(self.next_food, BoardSpec.get(trace.grid_size))
+        self.keyframes = []
+        self.restart()
+        while self.env.steps < len(self.actions):
+            if self.env.steps % keyframe_interval == 0:
+                self.keyframes.append(self.snapshot())
+            self.advance()
+
+    def __len__(self):
+        return len(self.actions)
+
+    def next_food(self):
+        if self.food_index == len(self.trace.foods):
+            # the snake filled the board, so no food was recorded
+            return self.env.food.pos
+        pos = self.trace.foods[self.food_index]
+        self.food_index += 1
+        return pos
+
+    def restart(self):
+        """
+        Put the replay back at the start of the game
+        """
+        env = self.env
+        env.snake = Snake(self.trace.snake_start, env.spec)
+        env.food = Food(self.trace.food_start)
+        env.score = env.steps = env.search_length = 0
+        env.done = False
+        env.death_cause = None
+        self.food_index = 0
+
+    def snapshot(self):
+        env = self.env
+        return (tuple(env.snake.blocks), env.snake.growing, env.food.pos, env.score, env.steps, env.search_length,
+                self.food_index)
+
+    def restore(self, snapshot):
+        blocks, growing, food_pos, score, steps, search_length, food_index = snapshot
+        env = self.env
+        env.snake = Snake(blocks[-1], env.spec)
+        env.snake.blocks = deque(blocks)
+        for pos in blocks[:-1]:
+            env.snake.grid[pos[1] + GRID_PAD, pos[0] + GRID_PAD] += 1
+        env.snake.growing = growing
+        env.food = Food(food_pos)
+        env.score, env.steps, env.search_length = score, steps, search_length
+        env.done = False
+        env.death_cause = None
+        self.food_index = food_index
+
+    def advance(self):
+        """
+        Play the next recorded step
+        """
+        env = self.env
+        step = env.steps
+        env.step(int(self.actions[step]))
+        if env.score != self.scores[step + 1]:
+            raise ValueError('trace does not match the game logic at step {}'.format(step))
+
+    def seek(self, step):
+        """
+        Move the replay to just after :step: steps have been played
+        :return: the replay's SnakeEnv in that state
+        """
+        if not 0 <= step <= len(self):
+            raise IndexError('step {} is outside the trace'.format(step))
+        if not self.keyframes:
+            self.restart()
+        elif step < self.env.steps or step - self.env.steps > self.keyframe_interval:
+            self.restore(self.keyframes[min(step // self.keyframe_interval, len(self.keyframes) - 1)])
+        while self.env.steps < step:
+            self.advance()
+        return self.env
+
+    def frames(self, start=0, every=1):
+        """
+        Yields the replay's SnakeEnv at steps start, start + every, ... and the final step
+        """
+        for step in list(range(start, len(self), every)) + [len(self)]:
+            yield self.seek(step)
+
+
+def record_game(snake_controller, food_controller=None, seed=None):
+    """
+    Plays a headless game and returns its trace
+    """
+    recorder = Recorder()
+    env = SnakeEnv(food_controller, recorder=recorder)
+    env.reset(seed)
+    env.run(snake_controller)
+    return recorder.trace
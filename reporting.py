@@ -0,0 +1,252 @@
+"""
+NEAT reporters whose memory and disk use stay bounded over long runs
+
+StreamingReporter appends one line of metrics per generation to a JSON lines file and only keeps the last few
+generations in memory; ProfileReporter does the same for profiling breakdowns, and HallOfFameReporter archives
+each generation's champion. IncrementalCheckpointer writes each distinct genome once, compressed, to an append-only
+pack file shared by all checkpoints; a checkpoint itself only refers to its genomes, so it stays small and loads
+quickly.
+"""
+import collections
+import copy
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import os
+import pickle
+import random
+import struct
+import time
+import zlib
+
+import neat
+import numpy as np
+from neat.reporting import BaseReporter, ReporterSet
+
+# fitness quantiles recorded each generation
+QUANTILES = (0, 25, 50, 75, 100)
+
+
+class StreamingReporter(BaseReporter):
+    """
+    Appends each generation's metrics to :filename: as one JSON line: fitness quantiles, mean and standard
+    deviation, species sizes, evaluation time and game steps per second. Only the last :window: generations are
+    kept in self.history, plus the best genome seen so far.
+    """
+    def __init__(self, filename='stats.jsonl', window=100, evaluator=None):
+        """
+        :param filename: file to append metrics to
+        :param window: generations to keep in memory
+        :param evaluator: evaluator, or evaluation function such as bot.train_generation, whose steps_played (game
+            steps of the last generation) gives steps/sec, if it counts them
+        """
+        self.filename = filename
+        self.history = collections.deque(maxlen=window)
+        self.evaluator = evaluator
+        self.best_genome = None
+        self.generation = None
+        self.start = None
+
+    def start_generation(self, generation):
+        self.generation = generation
+        self.start = time.perf_counter()
+
+    def post_evaluate(self, config, population, species, best_genome):
+        eval_seconds = time.perf_counter() - self.start
+        fitnesses = np.array([genome.fitness for genome in population.values()], dtype=float)
+        steps = getattr(self.evaluator, 'steps_played', None)
+
+        record = {
+            'generation': self.generation,
+            'time': round(time.time(), 3),
+            'eval_seconds': round(eval_seconds, 4),
+            'steps_per_sec': None if steps is None else round(steps / eval_seconds, 1),
+            'fitness_quantiles': [round(float(q), 4) for q in np.percentile(fitnesses, QUANTILES)],
+            'fitness_mean': round(float(fitnesses.mean()), 4),
+            'fitness_std': round(float(fitnesses.std()), 4),
+            'best_key': best_genome.key,
+            'species_sizes': {str(sid): len(s.members) for sid, s in species.species.items()},
+        }
+        self.history.append(record)
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+        if self.best_genome is None or best_genome.fitness > self.best_genome.fitness:
+            self.best_genome = copy.deepcopy(best_genome)
+
+    def get_fitness_mean(self):
+        """
+        Returns the mean fitness of each generation in the window
+        """
+        return [record['fitness_mean'] for record in self.history]
+
+
+class ProfileReporter(BaseReporter):
+    """
+    Prints each generation's profiling.Profiler breakdown, appends it with every genome's game steps, scores and
+    death causes to :filename: as a JSON line, and keeps :collapsed_filename: up to date with collapsed stacks of
+    the whole run.
+    """
+    def __init__(self, profiler, filename='profile.jsonl', collapsed_filename='profile.folded'):
+        self.profiler = profiler
+        self.filename = filename
+        self.collapsed_filename = collapsed_filename
+        self.generation = None
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        breakdown = self.profiler.end_generation()
+        print(self.profiler.report(breakdown))
+
+        record = dict(breakdown, generation=self.generation,
+                      death_causes={str(cause): n for cause, n in breakdown['death_causes'].items()},
+                      genomes={str(key): games for key, games in breakdown['genomes'].items()})
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.profiler.write_collapsed(self.collapsed_filename)
+
+
+class HallOfFameReporter(BaseReporter):
+    """
+    Adds each generation's best genome to a halloffame.HallOfFame
+    """
+    def __init__(self, hall_of_fame):
+        self.hall_of_fame = hall_of_fame
+        self.generation = None
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        self.hall_of_fame.add(best_genome, config, self.generation)
+
+
+class GenomePack():
+    """
+    Append-only file of compressed genomes, each stored once. A genome's content is everything but its key and
+    fitness, so copies of a genome (such as elites carried into the next generation) share one record.
+
+    Each record is a 16 byte content hash, the length of the compressed genome, then the compressed pickle.
+    """
+    RECORD_HEADER = struct.Struct('<16sI')
+
+    def __init__(self, filename):
+        self.filename = filename
+        # content hash -> (offset, length) of the compressed genome
+        self.index = {}
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                while True:
+                    header = f.read(self.RECORD_HEADER.size)
+                    if len(header) < self.RECORD_HEADER.size:
+                        break
+                    digest, length = self.RECORD_HEADER.unpack(header)
+                    self.index[digest] = (f.tell(), length)
+                    f.seek(length, io.SEEK_CUR)
+
+    def put(self, genome, f):
+        """
+        Store a genome if its content isn't stored yet
+        :param f: the pack file, open for appending
+        :return: (offset, length) of its record
+        """
+        content = copy.copy(genome)
+        content.key = content.fitness = None
+        data = pickle.dumps(content, protocol=pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if digest not in self.index:
+            data = zlib.compress(data)
+            f.write(self.RECORD_HEADER.pack(digest, len(data)))
+            self.index[digest] = (f.tell(), len(data))
+            f.write(data)
+        return self.index[digest]
+
+    @staticmethod
+    def read(f, offset, length):
+        """
+        Returns the genome whose record is at :offset: of the open pack file :f:, without its key and fitness
+        """
+        f.seek(offset)
+        return pickle.loads(zlib.decompress(f.read(length)))
+
+
+class IncrementalCheckpointer(BaseReporter):
+    """
+    Saves the population every :generation_interval: generations, like neat.Checkpointer. Genomes go to a shared
+    GenomePack, and the checkpoint file refers to them by position, so each checkpoint only adds the genomes that are
+    new since the last one. Reporters, which the species set refers to, aren't saved.
+    """
+    def __init__(self, generation_interval=50, directory='checkpoints', last_generation_checkpoint=-1):
+        """
+        :param generation_interval: generations between checkpoints
+        :param directory: directory for the checkpoints and their genome pack
+        :param last_generation_checkpoint: generation of the last checkpoint; when resuming, the restored one's, so it
+            isn't saved again straight away
+        """
+        self.generation_interval = generation_interval
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.pack = GenomePack(os.path.join(directory, 'genomes.pack'))
+        self.current_generation = None
+        self.last_generation_checkpoint = last_generation_checkpoint
+
+    def start_generation(self, generation):
+        self.current_generation = generation
+
+    def end_generation(self, config, population, species_set):
+        if self.current_generation - self.last_generation_checkpoint >= self.generation_interval:
+            self.save_checkpoint(config, population, species_set, self.current_generation)
+            self.last_generation_checkpoint = self.current_generation
+
+    def save_checkpoint(self, config, population, species_set, generation):
+        filename = os.path.join(self.directory, 'checkpoint-{}.gz'.format(generation))
+        print("Saving checkpoint to {0}".format(filename))
+
+        # reproduction hands out keys counting up, so the next key is one past the newest genome's
+        next_key = max(population) + 1
+        data = (generation, config, population, species_set, random.getstate(), next_key)
+        with open(self.pack.filename, 'ab') as pack_file, gzip.open(filename, 'wb', compresslevel=5) as f:
+            pickler = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+
+            def persistent_id(obj):
+                if isinstance(obj, config.genome_type):
+                    return ('genome',) + self.pack.put(obj, pack_file) + (obj.key, obj.fitness)
+                if isinstance(obj, ReporterSet):
+                    return ('reporters',)
+                return None
+            pickler.persistent_id = persistent_id
+            pickler.dump(data)
+
+    @staticmethod
+    def restore_checkpoint(filename):
+        """
+        Resumes the simulation from a checkpoint saved by save_checkpoint
+        :return: neat.Population
+        """
+        pack = os.path.join(os.path.dirname(filename), 'genomes.pack')
+        with open(pack, 'rb') as pack_file, gzip.open(filename, 'rb') as f:
+            unpickler = pickle.Unpickler(f)
+            # genomes referred to more than once, such as by the population and their species, stay one object
+            genomes = {}
+
+            def persistent_load(pid):
+                if pid[0] == 'reporters':
+                    return None
+                offset, length, key, fitness = pid[1:]
+                if (offset, key) not in genomes:
+                    genome = GenomePack.read(pack_file, offset, length)
+                    genome.key, genome.fitness = key, fitness
+                    genomes[offset, key] = genome
+                return genomes[offset, key]
+            unpickler.persistent_load = persistent_load
+            generation, config, population, species_set, rndstate, next_key = unpickler.load()
+
+        random.setstate(rndstate)
+        p = neat.Population(config, (population, species_set, generation))
+        species_set.reporters = p.reporters
+        p.reproduction.genome_indexer = itertools.count(next_key)
+        return p
@@ -0,0 +1,260 @@
+"""
+Scores trained genomes headlessly over a large range of seeded games
+
+    python score.py best_genome.pkl --games 100000 --workers 4
+
+Games are played in chunks of consecutive seeds, every live game of a chunk taking its step together with one batched
+network activation. Each finished chunk is appended to the output file as a JSON line, so results stream in as they
+are played, and a run that is interrupted picks up where it left off when started again with the same arguments.
+Game n of a genome is the same game eval_genome plays with seed first_seed + n.
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import pickle
+import time
+import numpy as np
+import engine
+from bot import local_states
+from engine import BoardSpec
+from fastnet import CompiledNetwork
+from vec_env import DEATH_CAUSES, BatchSnakeEnv
+
+# games played by a worker at once
+CHUNK_SIZE = 1000
+# score percentiles reported for each genome
+PERCENTILES = (1, 5, 10, 25, 50, 75, 90, 95, 99)
+
+
+def play_games(model, seeds, spec=None):
+    """
+    Plays one game with each seed, activating :model: on the observations of all live games at once
+    :param model: fastnet.CompiledNetwork
+    :param seeds: (N,) game seeds
+    :param spec: engine.BoardSpec of the boards; defaults to BoardSpec.get()
+    :return: (N,) arrays of the scores, steps and death causes (indices into vec_env.DEATH_CAUSES) of the games
+    """
+    env = BatchSnakeEnv(len(seeds), spec, auto_reset=False)
+    env.reset_games(np.arange(len(seeds)), seeds)
+
+    actions = np.zeros(len(seeds), dtype=np.int64)
+    live = np.arange(len(seeds))
+    while len(live):
+        states = local_states(env.grid[live], env.head[live], env.food[live], env.spec)
+        actions[live] = np.argmax(model.activate(states), axis=1)
+        if env.step(actions).any():
+            live = np.flatnonzero(~env.done)
+    return env.score, env.steps, env.death_cause
+
+
+def load_config(filename):
+    """
+    Loads a NEAT config from a pickle (such as best_config.pkl) or a config file (such as config-feedforward.txt)
+    """
+    if filename.endswith('.pkl'):
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+    import neat
+    return neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                              neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                              filename)
+
+
+def load_genomes(paths, config, top=1):
+    """
+    Loads the genomes to score
+    :param paths: pickled genomes, directories of them (every .pkl file that holds a genome), or halloffame.HallOfFame
+        directories
+    :param top: genomes to take from each hall of fame, fittest first
+    :return: dict of name -> genome
+    """
+    genomes = {}
+    for path in paths:
+        if os.path.exists(os.path.join(path, 'index.bin')):
+            from halloffame import HallOfFame
+            hall_of_fame = HallOfFame(path)
+            for entry in hall_of_fame.best(top):
+                genomes['{}#{}'.format(path, entry)] = hall_of_fame.genome(entry, config)
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.pkl'):
+                    with open(os.path.join(path, name), 'rb') as f:
+                        genome = pickle.load(f)
+                    if isinstance(genome, config.genome_type):
+                        genomes[os.path.join(path, name)] = genome
+        else:
+            with open(path, 'rb') as f:
+                genome = pickle.load(f)
+            if not isinstance(genome, config.genome_type):
+                raise ValueError('{} is not a pickled {}'.format(path, config.genome_type.__name__))
+            genomes[path] = genome
+    return genomes
+
+
+# genomes, config, board spec and compiled networks of the current worker process, sent once when it starts
+_worker = None
+
+def _init_worker(genomes, config, grid_size):
+    global _worker
+    _worker = {'genomes': genomes, 'config': config, 'spec': BoardSpec.get(grid_size), 'models': {}}
+
+def _score_chunk(task):
+    """
+    Plays :n_games: games of the named genome from :first_seed: on
+    :return: the chunk's JSON record
+    """
+    name, first_seed, n_games = task
+    models = _worker['models']
+    if name not in models:
+        models[name] = CompiledNetwork.create(_worker['genomes'][name], _worker['config'])
+
+    start = time.perf_counter()
+    scores, steps, causes = play_games(models[name], np.arange(first_seed, first_seed + n_games), _worker['spec'])
+    return {
+        'genome': name,
+        'grid_size': _worker['spec'].grid_size,
+        'first_seed': first_seed,
+        'games': n_games,
+        'seconds': round(time.perf_counter() - start, 4),
+        'steps': int(steps.sum()),
+        'scores': scores.tolist(),
+        'death_causes': dict(collections.Counter(DEATH_CAUSES[cause] for cause in causes.tolist())),
+    }
+
+
+def read_results(filename):
+    """
+    Returns the chunk records already in :filename:, skipping a last line cut short by an interruption
+    """
+    records = []
+    if not os.path.exists(filename):
+        return records
+    with open(filename) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def summarize(records):
+    """
+    Returns the score distribution, death causes and speed of the games in a genome's chunk records
+    """
+    scores = np.concatenate([record['scores'] for record in records])
+    causes = collections.Counter()
+    for record in records:
+        causes.update(record['death_causes'])
+    steps = sum(record['steps'] for record in records)
+    seconds = sum(record['seconds'] for record in records)
+    return {
+        'games': len(scores),
+        'mean': float(scores.mean()),
+        'std': float(scores.std()),
+        'min': int(scores.min()),
+        'max': int(scores.max()),
+        'percentiles': dict(zip(PERCENTILES, np.percentile(scores, PERCENTILES).tolist())),
+        'death_causes': {cause: n / len(scores) for cause, n in causes.most_common()},
+        'steps_per_sec': steps / seconds if seconds else None,
+    }
+
+
+def score(genomes, config, games, first_seed=0, workers=1, output='scores.jsonl', chunk_size=CHUNK_SIZE,
+          grid_size=engine.GRID_SIZE):
+    """
+    Plays :games: games with each genome, appending each finished chunk to :output: and skipping chunks it already
+    holds
+    :param genomes: dict of name -> genome
+    :param workers: number of processes playing chunks
+    :return: dict of genome name -> summary (see summarize)
+    """
+    tasks = [(name, seed, min(chunk_size, first_seed + games - seed))
+             for name in genomes for seed in range(first_seed, first_seed + games, chunk_size)]
+    done = {(record['genome'], record['grid_size'], record['first_seed'], record['games']): record
+            for record in read_results(output)}
+    todo = [task for task in tasks if (task[0], grid_size) + task[1:] not in done]
+    print('{} of {} chunks already played'.format(len(tasks) - len(todo), len(tasks)))
+
+    # whether the last run was interrupted mid-line
+    cut_short = False
+    if os.path.exists(output) and os.path.getsize(output):
+        with open(output, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            cut_short = f.read() != b'\n'
+
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(genomes, config, grid_size))
+        results = pool.imap_unordered(_score_chunk, todo)
+    else:
+        pool = None
+        _init_worker(genomes, config, grid_size)
+        results = map(_score_chunk, todo)
+
+    start = time.perf_counter()
+    steps = 0
+    try:
+        with open(output, 'a') as f:
+            if cut_short:
+                f.write('\n')
+            for n, record in enumerate(results, 1):
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+                f.flush()
+                done[record['genome'], grid_size, record['first_seed'], record['games']] = record
+                steps += record['steps']
+                elapsed = time.perf_counter() - start
+                print('{}/{} chunks, {:,.0f} steps/sec'.format(n, len(todo), steps / elapsed), end='\r', flush=True)
+    except BaseException:
+        # stop the workers' chunks too when a chunk fails or the run is interrupted
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if todo:
+        print()
+
+    return {name: summarize([done[(name, grid_size) + task[1:]] for task in tasks if task[0] == name])
+            for name in genomes}
+
+
+def report(name, summary):
+    """
+    Returns a genome's summary as text
+    """
+    return '\n'.join([
+        '{}: {:,} games, score {:.2f} +- {:.2f}, min {}, max {}'.format(
+            name, summary['games'], summary['mean'], summary['std'], summary['min'], summary['max']),
+        '  percentiles: ' + ', '.join('p{} {:g}'.format(p, q) for p, q in summary['percentiles'].items()),
+        '  death causes: ' + ', '.join('{} {:.1%}'.format(cause, share)
+                                       for cause, share in summary['death_causes'].items()),
+        '  steps/sec per worker: {:,.0f}'.format(summary['steps_per_sec'] or 0),
+    ])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('genomes', nargs='+',
+                        help='pickled genomes, directories of .pkl genomes, or hall of fame directories')
+    parser.add_argument('--config', default='best_config.pkl', help='pickled NEAT config or NEAT config file')
+    parser.add_argument('--games', type=int, default=10_000, help='games to play with each genome')
+    parser.add_argument('--first-seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes playing games')
+    parser.add_argument('--output', default='scores.jsonl', help='file to stream results to, and resume from')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='games played by a worker at once')
+    parser.add_argument('--grid-size', type=int, default=engine.GRID_SIZE, help='width and height of the board')
+    parser.add_argument('--top', type=int, default=1, help='genomes to score from each hall of fame')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    genomes = load_genomes(args.genomes, config, args.top)
+    if not genomes:
+        parser.error('no genomes found')
+    summaries = score(genomes, config, args.games, args.first_seed, args.workers, args.output, args.chunk_size,
+                      args.grid_size)
+    for name, summary in summaries.items():
+        print(report(name, summary))
@@ -0,0 +1,144 @@
+"""
+Uniform grid spatial index for the tank arena
+
+Sprites are bucketed by the cell their rect's center falls in, so nearest-neighbour and collision queries only look
+at the cells around the query instead of every sprite. Results match a linear scan over the sprites in the order they
+were added, ties included.
+"""
+import collections
+
+# width and height of each cell, in pixels
+CELL_SIZE = 32
+
+
+class GridIndex():
+    """
+    Index of sprites with .rect and .id attributes. Call update() after moving a sprite, and remove() after
+    killing it.
+    """
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        # cell -> {sprite: insertion order}
+        self.cells = collections.defaultdict(dict)
+        # sprite -> (cell, insertion order)
+        self.where = {}
+        self.next_order = 0
+        # number of sprites with each id
+        self.id_counts = collections.Counter()
+        # bounding box of every cell that has held a sprite
+        self.min_cell = None
+        self.max_cell = None
+
+    def __len__(self):
+        return len(self.where)
+
+    def cell(self, point):
+        return point[0] // self.cell_size, point[1] // self.cell_size
+
+    def _place(self, sprite, order):
+        cell = self.cell(sprite.rect.center)
+        self.cells[cell][sprite] = order
+        self.where[sprite] = (cell, order)
+        if self.min_cell is None:
+            self.min_cell, self.max_cell = cell, cell
+        else:
+            self.min_cell = (min(self.min_cell[0], cell[0]), min(self.min_cell[1], cell[1]))
+            self.max_cell = (max(self.max_cell[0], cell[0]), max(self.max_cell[1], cell[1]))
+
+    def _unplace(self, sprite):
+        cell, order = self.where.pop(sprite)
+        del self.cells[cell][sprite]
+        if not self.cells[cell]:
+            del self.cells[cell]
+        return cell, order
+
+    def add(self, sprite):
+        self._place(sprite, self.next_order)
+        self.next_order += 1
+        self.id_counts[sprite.id] += 1
+
+    def remove(self, sprite):
+        if sprite in self.where:
+            self._unplace(sprite)
+            self.id_counts[sprite.id] -= 1
+
+    def update(self, sprite):
+        """
+        Move a sprite to the cell of its current position
+        """
+        cell, order = self.where[sprite]
+        if self.cell(sprite.rect.center) != cell:
+            self._unplace(sprite)
+            self._place(sprite, order)
+
+    def _ring(self, center, r):
+        """
+        Yields the cells at Chebyshev distance :r: from :center:
+        """
+        cx, cy = center
+        if r == 0:
+            yield center
+            return
+        for x in range(cx - r, cx + r + 1):
+            yield x, cy - r
+            yield x, cy + r
+        for y in range(cy - r + 1, cy + r):
+            yield cx - r, y
+            yield cx + r, y
+
+    def nearest(self, point, exclude_id=None):
+        """
+        Returns the sprite whose rect's center is closest to :point:, ignoring sprites with id :exclude_id:; ties go
+        to the sprite added first
+        :return: sprite, or None if there are no other sprites
+        """
+        if len(self.where) == self.id_counts[exclude_id]:
+            return None
+
+        best, best_key = None, None
+
+        def consider(sprite, order):
+            nonlocal best, best_key
+            if sprite.id == exclude_id:
+                return
+            center = sprite.rect.center
+            key = ((center[0] - point[0]) ** 2 + (center[1] - point[1]) ** 2, order)
+            if best_key is None or key < best_key:
+                best, best_key = sprite, key
+
+        center = self.cell(point)
+        # rings needed to reach every cell that has held a sprite
+        max_r = max(abs(center[0] - self.min_cell[0]), abs(center[0] - self.max_cell[0]),
+                    abs(center[1] - self.min_cell[1]), abs(center[1] - self.max_cell[1]))
+        scanned = 0
+        for r in range(max_r + 1):
+            # a far sprite would take more cell lookups than a plain scan over every sprite
+            scanned += 8 * r or 1
+            if scanned > len(self.where):
+                for sprite, (cell, order) in self.where.items():
+                    consider(sprite, order)
+                return best
+
+            for cell in self._ring(center, r):
+                for sprite, order in self.cells.get(cell, {}).items():
+                    consider(sprite, order)
+            # sprites outside the rings searched so far are more than r cells away
+            if best_key is not None and best_key[0] <= (r * self.cell_size) ** 2:
+                break
+        return best
+
+    def colliding(self, rect, margin):
+        """
+        Returns the sprites whose rects overlap :rect:, in the order they were added
+        :param margin: most pixels any sprite's rect reaches from its center
+        """
+        x0, y0 = self.cell((rect.left - margin, rect.top - margin))
+        x1, y1 = self.cell((rect.right + margin, rect.bottom + margin))
+        hits = []
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                for sprite, order in self.cells.get((x, y), {}).items():
+                    if rect.colliderect(sprite.rect):
+                        hits.append((order, sprite))
+        hits.sort(key=lambda hit: hit[0])
+        return [sprite for order, sprite in hits]
@@ -0,0 +1,198 @@
+"""
+Vectorized Snake environment that advances many games at once
+
+Every game's state lives in NumPy arrays, so one call to step() moves all of them. Given the same seed and the same
+actions, each game plays out exactly like engine.SnakeEnv (and so game.play). Seeded games draw from counter-based
+streams (engine.draw) rather than a random state per game, so starting games and spawning food are array operations
+over all the games that need them too.
+"""
+import numpy as np
+import engine
+from engine import GRID_PAD, MAX_SEARCH_LENGTH, WALL, BoardSpec, draw, stream_key
+
+# (dx, dy) for each action: up, right, down, left
+MOVES = np.array(engine.MOVES)
+
+# death causes, as stored in BatchSnakeEnv.death_cause
+ALIVE, TIMEOUT, OUT_MAP, HIT_SNAKE, BOARD_FULL = range(5)
+DEATH_CAUSES = (None, 'timeout', 'out map', 'hit snake', 'board full')
+
+
+class BatchSnakeEnv():
+    """
+    N games of Snake stored as arrays:
+        head, food: (N, 2) positions
+        body: (N, L, 2) ring buffer of snake blocks; body[n, head_idx[n]] is the head and the length[n] - 1 entries
+            before it (wrapping around) are the rest of the snake
+        grid: (N, grid_size + 2 * GRID_PAD, grid_size + 2 * GRID_PAD) occupancy counts, indexed
+            [game, y + GRID_PAD, x + GRID_PAD] like engine.Snake.grid
+        score, steps, search_length: (N,) counters
+    """
+    def __init__(self, n_games, spec=None, auto_reset=True):
+        """
+        :param n_games: number of games to play at once
+        :param spec: engine.BoardSpec of every board; defaults to BoardSpec.get()
+        :param auto_reset: whether step() immediately starts a new game in place of each one that ends
+        """
+        self.n_games = n_games
+        self.spec = BoardSpec.get() if spec is None else spec
+        grid_size = self.grid_size = self.spec.grid_size
+        self.auto_reset = auto_reset
+
+        # a snake can never be longer than the board, plus one block for the head leaving it
+        self.max_length = grid_size * grid_size + 1
+
+        self.head = np.zeros((n_games, 2), dtype=np.int64)
+        self.food = np.zeros((n_games, 2), dtype=np.int64)
+        self.body = np.zeros((n_games, self.max_length, 2), dtype=np.int64)
+        self.head_idx = np.zeros(n_games, dtype=np.int64)
+        self.length = np.ones(n_games, dtype=np.int64)
+        self.grid = np.zeros((n_games, grid_size + 2 * GRID_PAD, grid_size + 2 * GRID_PAD), dtype=np.int8)
+        # view of the grid without its border
+        self.board = self.grid[:, GRID_PAD:-GRID_PAD, GRID_PAD:-GRID_PAD]
+
+        self.score = np.zeros(n_games, dtype=np.int64)
+        self.steps = np.zeros(n_games, dtype=np.int64)
+        self.search_length = np.zeros(n_games, dtype=np.int64)
+        self.done = np.zeros(n_games, dtype=bool)
+        self.death_cause = np.zeros(n_games, dtype=np.int8)
+
+        # results of the games that ended on the last step(), kept after they are auto-reset
+        self.final_score = np.zeros(n_games, dtype=np.int64)
+        self.final_steps = np.zeros(n_games, dtype=np.int64)
+        self.final_seed = np.zeros(n_games, dtype=np.int64)
+        self.final_death_cause = np.zeros(n_games, dtype=np.int8)
+
+        self.seeds = np.zeros(n_games, dtype=np.int64)
+        # each game's random stream (engine.stream_key of its seed) and the draws made from it so far
+        self.keys = np.zeros(n_games, dtype=np.uint64)
+        self.draws = np.zeros(n_games, dtype=np.uint64)
+        self.next_seed = 0
+
+    def reset(self, seed=None):
+        """
+        Start a new game on every board. Game i is seeded with seed + i, and games started by auto-reset take the
+        following seeds in order.
+        :param seed: first seed; None picks one at random
+        :return: None
+        """
+        if seed is None:
+            seed = np.random.randint(2 ** 31)
+        self.next_seed = seed + self.n_games
+        self.reset_games(np.arange(self.n_games), seed + np.arange(self.n_games))
+
+    def reset_game(self, i, seed=None):
+        """
+        Start a new game on board i
+        :param seed: seed for the game; defaults to the next unused seed
+        """
+        self.reset_games(np.array([i]), None if seed is None else np.array([seed]))
+
+    def reset_games(self, games, seeds=None):
+        """
+        Start new games on the given boards
+        :param games: (G,) board indices
+        :param seeds: (G,) seeds for the games; defaults to the next unused seeds, in order
+        """
+        if seeds is None:
+            seeds = self.next_seed + np.arange(len(games))
+            self.next_seed += len(games)
+        self.seeds[games] = seeds
+        keys = self.keys[games] = stream_key(np.asarray(seeds, dtype=np.int64).astype(np.uint64))
+
+        # the first four draws are the snake's and the food's x and y, like engine.SnakeEnv.reset
+        positions = draw(keys[:, None], np.arange(4, dtype=np.uint64), np.uint64(self.grid_size)).astype(np.int64)
+        self.draws[games] = 4
+        head = self.head[games] = positions[:, :2]
+        self.food[games] = positions[:, 2:]
+
+        self.grid[games] = 0
+        self.head_idx[games] = 0
+        self.length[games] = 1
+        self.body[games, 0] = head
+        self.board[games, head[:, 1], head[:, 0]] = 1
+
+        self.score[games] = 0
+        self.steps[games] = 0
+        self.search_length[games] = 0
+        self.done[games] = False
+        self.death_cause[games] = ALIVE
+
+    def spawn_food(self, games):
+        """
+        Respawn the food on the given boards, each on a random cell not covered by its snake
+        :param games: (G,) board indices
+        :return: (G,) boolean array, False where the snake covers the whole board
+        """
+        free = self.board[games].reshape(len(games), self.spec.n_cells) == 0
+        n_free = free.sum(axis=1)
+        room = n_free > 0
+        # the free cell each board's next draw picks, counting them in increasing order like Snake.free_cells
+        pick = draw(self.keys[games], self.draws[games], n_free.astype(np.uint64)).astype(np.int64)
+        cell = np.argmax(np.cumsum(free, axis=1) > pick[:, None], axis=1)
+        self.draws[games[room]] += 1
+        self.food[games[room]] = np.stack((cell % self.grid_size, cell // self.grid_size), axis=1)[room]
+        return room
+
+    def step(self, actions):
+        """
+        Advance every unfinished game by one move
+        :param actions: (N,) array of directions (0 = up, 1 = right, 2 = down, 3 = left)
+        :return: (N,) boolean array of the games that ended on this step
+        """
+        live = np.flatnonzero(~self.done)
+        ended = np.zeros(self.n_games, dtype=bool)
+
+        # snakes whose head is on the food eat it and grow on this move; games with no room left for food end
+        eat = live[(self.head[live] == self.food[live]).all(axis=1)]
+        self.score[eat] += 1
+        self.search_length[eat] = 0
+        full = eat[~self.spawn_food(eat)]
+        if len(full):
+            self.death_cause[full] = BOARD_FULL
+            ended[full] = True
+            live = live[~ended[live]]
+            eat = eat[~ended[eat]]
+        grow = np.zeros(self.n_games, dtype=bool)
+        grow[eat] = True
+
+        # vacate the tails of snakes that aren't growing
+        move = live[~grow[live]]
+        tail_idx = (self.head_idx[move] - self.length[move] + 1) % self.max_length
+        tail = self.body[move, tail_idx]
+        self.board[move, tail[:, 1], tail[:, 0]] -= 1
+        self.length[eat] += 1
+
+        # move heads, looking up the cells they move to
+        actions = np.asarray(actions)[live]
+        new_cell = self.spec.neighbours[self.head[live, 1] * self.grid_size + self.head[live, 0], actions]
+        new_head = self.head[live] + MOVES[actions]
+        self.head[live] = new_head
+        self.head_idx[live] = (self.head_idx[live] + 1) % self.max_length
+        self.body[live, self.head_idx[live]] = new_head
+        self.search_length[live] += 1
+        self.steps[live] += 1
+
+        # check for deaths, in the same order as the original game loop
+        inside = new_cell != WALL
+        padded = self.spec.padded[np.where(inside, new_cell, 0)]
+        hit = inside & (self.grid.reshape(self.n_games, -1)[live, padded] > 0)
+        cause = np.select([self.search_length[live] > MAX_SEARCH_LENGTH, ~inside, hit],
+                          [TIMEOUT, OUT_MAP, HIT_SNAKE], ALIVE)
+        self.death_cause[live] = cause
+
+        # mark the new heads as occupied
+        on_board = live[inside]
+        self.board[on_board, new_head[inside, 1], new_head[inside, 0]] += 1
+
+        ended[live[cause != ALIVE]] = True
+        self.done |= ended
+
+        finished = np.flatnonzero(ended)
+        self.final_score[finished] = self.score[finished]
+        self.final_steps[finished] = self.steps[finished]
+        self.final_seed[finished] = self.seeds[finished]
+        self.final_death_cause[finished] = self.death_cause[finished]
+        if self.auto_reset and len(finished):
+            self.reset_games(finished)
+        return ended
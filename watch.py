@@ -3,8 +3,8 @@ Code to watch the best bot play Snake
 """
 import pickle
 import game, bot
-import neat
 import numpy as np
+from replay import Replay, Trace
 
 def preset_food_pos_maker(positions):
     """
@@ -31,6 +31,7 @@ def watch_best(genome_file, config_file, food_pos_file):
     food_positions = pickle.load(open(food_pos_file, 'rb'))
 
     # Generate model from best genome
+    import neat
     model = neat.nn.FeedForwardNetwork.create(genome, config)
 
     ## Play game
@@ -57,6 +58,7 @@ def watch_games(genome_file, config_file):
     config = pickle.load(open(config_file, 'rb'))
 
     # Generate model from best genome
+    import neat
     model = neat.nn.FeedForwardNetwork.create(genome, config)
 
     # Must be true to observe game being played
@@ -73,6 +75,49 @@ def watch_games(genome_file, config_file):
 
 
 
-game.FRAMERATE = 30
-watch_best('best_genome.pkl', 'best_config.pkl', 'best_food_pos.pkl')
-watch_games('best_genome.pkl', 'best_config.pkl')
\ No newline at end of file
+def watch_champion(entry=None, directory='halloffame'):
+    """
+    Plays Snake repeatedly with a champion from a hall of fame archive
+    :param entry: entry number of the champion; defaults to the fittest one
+    :param directory: directory of the halloffame.HallOfFame
+    """
+    from halloffame import HallOfFame
+    hall_of_fame = HallOfFame(directory)
+    if entry is None:
+        entry = hall_of_fame.best()[0]
+    champion = hall_of_fame.entries[entry]
+    print('Entry {}: genome {} of generation {}, fitness {}'.format(entry, champion['key'], champion['generation'],
+                                                                   champion['fitness']))
+
+    snake_controller = bot.bot_mover_maker(hall_of_fame.network(entry))
+    while True:
+        print('Score:', game.play(snake_controller, game.rand_pos))
+
+
+def watch_replay(trace_file, start=0, every=1):
+    """
+    Watch a recorded game, without re-running the network that played it
+    :param trace_file: file saved by replay.Trace.save
+    :param start: step to start watching from
+    :param every: show every :every:-th step, to skim through long games
+    """
+    replay = Replay(Trace.load(trace_file))
+
+    import pygame
+    view = game.get_renderer(replay.env.spec)
+    view.new_game()
+    clock = pygame.time.Clock()
+
+    for env in replay.frames(start, every):
+        if view.quit_requested():
+            break
+        view.submit(env.snake, env.food)
+        clock.tick(game.FRAMERATE)
+
+    print('Score:', replay.trace.score)
+
+
+if __name__ == '__main__':
+    game.FRAMERATE = 30
+    watch_best('best_genome.pkl', 'best_config.pkl', 'best_food_pos.pkl')
+    watch_games('best_genome.pkl', 'best_config.pkl')
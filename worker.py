@@ -0,0 +1,14 @@
+"""
+State of the current process when it's a worker in one of the pools that evaluate genomes
+
+bot.PoolEvaluator and arena.ShardedEvaluator start their pools with init_config as the initializer, so each worker
+receives the NEAT config once and reads it from worker.config for every task.
+"""
+
+# NEAT config of the current pool worker process, sent once when the worker starts
+config = None
+
+
+def init_config(worker_config):
+    global config
+    config = worker_config